@@ -4,7 +4,7 @@ import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
 from tools.widgets import render_time_controls, get_time_range
-from tools.utils import load_data_fromAPI, get_basic_info,load_data_fromAPI,get_elhub_data,plot_lag_window_center
+from tools.utils import load_weather_frame, get_basic_info,get_energy_cube,plot_lag_window_center,get_weather_cell
 from datetime import datetime
 
 
@@ -36,6 +36,8 @@ def run():
     # 3. Show current selection
     st.write(f"**Area:** {defined_area}")
     st.write(f"**Coordinates:** {lat:.4f}, {lon:.4f}")
+    cell_lat, cell_lon = get_weather_cell(lat, lon)
+    st.write(f"**Weather grid cell (ERA5 0.25°):** {cell_lat:.2f}, {cell_lon:.2f}")
 
 
     # --------------------- Select year and month for correlation analysis --------------------- 
@@ -52,13 +54,6 @@ def run():
     end_dt   = start_dt + pd.offsets.MonthEnd(0)
     st.write(f"**Selected time range:** {start_dt.strftime('%Y-%m-%d')} → {end_dt.strftime('%Y-%m-%d')}")
 
-    # Load weather data
-    weather_df = load_data_fromAPI(lon, lat, selected_year=defined_year)
-
-    if weather_df is None or weather_df.empty:
-        st.warning("No data returned for this location/year.")
-        st.stop()
-
     # Select meteorological variable
     meteo_options = {
         "Temperature (2m)": "temperature_2m",
@@ -73,35 +68,6 @@ def run():
         selected_meteo_label = col1.selectbox("Select meteorological variable", meteo_options.keys(), index=0)
         selected_meteo_col = meteo_options[selected_meteo_label]
 
-    # Filter weather data to relevant columns and the defined month
-    weather_df["date"] = pd.to_datetime(weather_df["date"])
-    weather_df = weather_df[weather_df["date"].dt.month == defined_month].copy().reset_index(drop=True)
-    df_weather = weather_df[["date", selected_meteo_col]].copy()
-
-    # Handle the edge case for October
-    if weather_df['date'].dt.month.iloc[0] == 10:
-        x = weather_df.iloc[:-2,:].copy()
-    else:
-        x = weather_df.iloc[:-1,:].copy()
-
-    weather_variable = weather_df.columns.tolist()
-    weather_variable.remove("date")
-
-    # st.write(df_weather.head())
-
-    # Load energy data
-    df_prod, df_cons = get_elhub_data(start_dt, end_dt)
-
-    # Filter energy data to the defined year, defined month, and defined area
-    def filter_year(df, selected_year, selected_month, selected_area, time_col="starttime"):
-        """Return rows from df where the year and area match."""
-        if df.empty:
-            return df
-        return df[(df[time_col].dt.year == selected_year) & (df["pricearea"] == selected_area) & (df[time_col].dt.month == selected_month)].copy().reset_index(drop=True)
-
-    df_prod_selected = filter_year(df_prod, defined_year, defined_month, defined_area)
-    df_cons_selected = filter_year(df_cons, defined_year, defined_month, defined_area)
-
     with col2:
         energy_options = {
             "Production – Hydro": ("Production", "hydro"),
@@ -118,13 +84,28 @@ def run():
         selected_energy_label = col2.selectbox("Select energy variable", energy_options.keys())
         mode, group = energy_options[selected_energy_label]
 
-    if mode == "Production":
-        df_energy = df_prod_selected[df_prod_selected["productiongroup"] == group].copy().reset_index(drop=True)
-    else:
-        df_energy = df_cons_selected[df_cons_selected["consumptiongroup"] == group].drop(['year','month'], axis=1).copy().reset_index(drop=True)
+    # Load weather data: only the selected variable for the selected month
+    weather = load_weather_frame(lon, lat, start_dt, end_dt, variables=[selected_meteo_col])
+    month_label = f"{defined_year}-{defined_month:02d}"
+
+    if weather is None or month_label not in weather.month_offsets:
+        st.warning("No data returned for this location/year.")
+        st.stop()
+
+    # The defined month is a row slice of the cached arrays (no date parsing or masks);
+    # the energy series below is the same local month, hour for hour
+    rows = weather.month_slice(month_label)
+    x = weather.to_frame(rows=rows)
+
+    weather_variable = weather.variables
+
+
+    # Load energy data: only the dataset of the selected energy variable, as an area × group × hour cube
+    cube = get_energy_cube(mode, start_dt, end_dt)
 
-    df_energy = df_energy.set_index("starttime")
-    y = df_energy["quantitykwh"].sort_index()
+    # The defined area/group/month is a view of the cube (no year/month/area masks)
+    # (hours without data are kept as NaN, so y stays aligned with the weather hours)
+    y = cube.series(defined_area, group, cube.month_slice(month_label), dropna=False)
     # st.write(df_energy.head())
     # y= df_energy["quantitykwh"].reset_index(drop=True)
     # st.write(y.head())
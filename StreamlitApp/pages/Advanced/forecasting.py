@@ -4,7 +4,10 @@ import numpy as np
 import plotly.graph_objects as go
 import statsmodels.api as sm
 
-from tools.utils import get_elhub_data,get_basic_info,load_data_fromAPI
+from tools.utils import aggregate_energy,get_basic_info,load_weather_range,get_weather_cell
+
+# Longest forecast horizon offered by the slider; weather is loaded to cover it up front
+MAX_HORIZON_DAYS = 30
 
 def run():
     # -------------------------------------------------------------
@@ -35,6 +38,8 @@ def run():
     # Display them
     st.write(f"**Area:** {defined_area}")
     st.write(f"**Coordinates:** {lat:.4f}, {lon:.4f}")
+    cell_lat, cell_lon = get_weather_cell(lat, lon)
+    st.write(f"**Weather grid cell (ERA5 0.25°):** {cell_lat:.2f}, {cell_lon:.2f}")
 
     # -------------------------------------------------------------
     # 2) Training period selection
@@ -127,9 +132,11 @@ def run():
 
                 # Align weather to the same time range as energy
                 train_start_tz = pd.to_datetime(train_start_dt).tz_localize("Europe/Oslo")
-                train_end_tz   = pd.to_datetime(train_end_dt).tz_localize("Europe/Oslo")
-                weather_df_raw = load_data_fromAPI(lon, lat, selected_year=train_start_dt.year)
-                weather_df = weather_df_raw[(weather_df_raw["date"] >= train_start_tz) &(weather_df_raw["date"] <= train_end_tz)].reset_index(drop=True)
+                # Exclusive end: the local midnight after the last training day, so every hour of that day is kept
+                train_stop_tz  = (pd.to_datetime(train_end_dt) + pd.Timedelta(days=1)).tz_localize("Europe/Oslo")
+                # One request for the training window plus the longest possible forecast horizon
+                weather_df_raw = load_weather_range(lon, lat, train_start_dt, train_end_dt + pd.Timedelta(days=MAX_HORIZON_DAYS), variables=meteo_vars)
+                weather_df = weather_df_raw[(weather_df_raw["date"] >= train_start_tz) &(weather_df_raw["date"] < train_stop_tz)].reset_index(drop=True)
                 exog_df = weather_df.set_index("date")[meteo_vars]
 
                 agg_dict = {
@@ -172,14 +179,14 @@ def run():
     # 5) Forecast horizon
     # -------------------------------------------------------------
     st.markdown(f"#### ⏳ Select Forecast Horizon")
-    horizon = st.slider("Forecast Horizon (days)", 2, 30, 7)
+    horizon = st.slider("Forecast Horizon (days)", 2, MAX_HORIZON_DAYS, 7)
     exog_future = None
     if use_exog:
         # -------------------------------------------------------------
         # Load future weather for exogenous variables
         # -------------------------------------------------------------
-        future_weather_raw = load_data_fromAPI(lon, lat, selected_year=train_end_dt.year + 1)
-        future_weather = pd.concat([weather_df_raw, future_weather_raw])
+        # weather_df_raw already extends MAX_HORIZON_DAYS past the training window
+        future_weather = weather_df_raw
         #future_weather_raw["date"] = pd.to_datetime(future_weather_raw["date"]).dt.tz_convert("Europe/Oslo")
         agg_dict = {
                     "temperature_2m": "mean",      # temperature → daily mean
@@ -209,50 +216,24 @@ def run():
         # st.write(exog_future.head())
 
 
-    df_prod, df_cons = get_elhub_data(train_start_dt, train_end_dt)
-
-    # --- Filter helper ---
-    def filter_energy(df, mode, group, area, train_start_dt, train_end_dt):
-        if df.empty:
-            return pd.DataFrame()
-
-        df["starttime"] = pd.to_datetime(df["starttime"])
-
-        if mode == "Production":
-            sub = df[(df["productiongroup"] == group) & (df["pricearea"] == area)]
-        else:
-            sub = df[(df["consumptiongroup"] == group) & (df["pricearea"] == area)]
-
-        # Year filter
-        sub = sub[
-            (sub["starttime"] >= train_start_dt) &
-            (sub["starttime"] <= train_end_dt)
-        ]
-        # Sort and reset
-        return sub.sort_values("starttime").reset_index(drop=True)
-
-
-    # choose df based on mode
-    if mode == "Production":
-        df_energy = filter_energy(df_prod, mode, group, defined_area, train_start_dt, train_end_dt)
-        value_col = "quantitykwh"
-    else:
-        df_energy = filter_energy(df_cons, mode, group, defined_area, train_start_dt, train_end_dt)
-        value_col = "quantitykwh"
+    # --- Daily totals of the selected area/group, summed in MongoDB ---
+    # (one document per hour is kept first, like drop_duplicates on starttime)
+    df_energy = aggregate_energy(
+        mode, train_start_dt, train_end_dt,
+        areas=defined_area, groups=group, granularity="D", by=(), unique_hours=True,
+    )
 
     if df_energy.empty:
         st.error("No energy data found for this selection.")
         st.stop()
 
-    # --- Prepare training data ---
-    df_energy = df_energy.drop_duplicates(subset="starttime")
+    value_col = "quantitykwh"
+
     # --- Prepare time series y(t) ---
-    df_energy = df_energy[["starttime", value_col]].rename(columns={"starttime": "time", value_col: "value"})
-    # df_energy = df_energy.set_index("time").asfreq("H")   # ensure hourly frequency
     df_energy = (
-        df_energy.set_index("time")
-        .resample("D")       # daily
-        .sum()               # total energy of the day
+        df_energy.rename(columns={"period": "time", "quantitykwh": "value"})
+        .set_index("time")
+        .asfreq("D", fill_value=0)   # days without data count as 0, like resample("D").sum()
     )
     df_energy["value"] = df_energy["value"].interpolate()  # fill missing hours
 
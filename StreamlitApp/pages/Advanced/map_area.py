@@ -1,5 +1,5 @@
 from tools.widgets import render_time_selector
-from tools.utils import (get_elhub_data, get_area_means)
+from tools.utils import (area_means_table, get_weather_cell)
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
@@ -17,29 +17,16 @@ def run():
 
     aggregation, start_dt, end_dt = render_time_selector()
 
-    # Initialize data cache in session state
-    if "data_cache" not in st.session_state:
-        st.session_state.data_cache = {}
-
-    def make_time_key(start, end):
-        return f"{start.strftime('%Y%m%d')}_{end.strftime('%Y%m%d')}"
-
     # --------------------- Load data ---------------------
-
-    time_key = make_time_key(start_dt, end_dt)
-
-    if time_key in st.session_state.data_cache:
-        df_prod, df_cons = st.session_state.data_cache[time_key]
-        st.info(f"Using cached data for {start_dt.date()} → {end_dt.date()}")
-    else:
-        with st.spinner(f"Fetching data {start_dt.date()} → {end_dt.date()} from MongoDB..."):
-            df_prod, df_cons = get_elhub_data(start_dt, end_dt)
-            st.session_state.data_cache[time_key] = (df_prod, df_cons)
-        st.success(f"Data loaded & cached for {start_dt.date()} → {end_dt.date()}")
-
+    # One cached table per data mode with the mean of every price area and group (from the rollups when built):
+    # switching mode or group below only looks up rows in these tables
+    group_fields = {"Production": "productiongroup", "Consumption": "consumptiongroup"}
+    with st.spinner(f"Aggregating data {start_dt.date()} → {end_dt.date()}..."):
+        tables = {m: area_means_table(m, start_dt, end_dt, aggregation) for m in group_fields}
+    groups_by_mode = {m: sorted(tables[m][group_fields[m]].unique()) for m in group_fields}
 
     # If no data → stop
-    if (df_prod is None or df_prod.empty) and (df_cons is None or df_cons.empty):
+    if not groups_by_mode["Production"] and not groups_by_mode["Consumption"]:
         st.error("No data found for the selected period.")
         st.stop()
 
@@ -60,10 +47,7 @@ def run():
         mode = st.selectbox("Data Type", ["Production", "Consumption"], key="mode")
 
     # Select correct group list based on mode
-    if mode == "Production":
-        groups = sorted(df_prod["productiongroup"].dropna().unique())
-    else:
-        groups = sorted(df_cons["consumptiongroup"].dropna().unique())
+    groups = groups_by_mode[mode]
 
     with col2:
         group = st.selectbox("Group", groups, key="group")
@@ -126,10 +110,9 @@ def run():
                 return fid
         return None
 
-    df = df_prod if mode == "Production" else df_cons
-
     # --------------------- Compute mean values per area ---------------------
-    df_map = get_area_means(df, mode, group, start_dt, end_dt, aggregation)
+    table = tables[mode]
+    df_map = table.loc[table[group_fields[mode]] == group, ["area", "value_raw", "value"]].reset_index(drop=True)
     df_map["fid"] = df_map["area"].map(name_to_id)
     df_map = df_map.dropna(subset=["fid"]).copy()
     # Build value map for info box
@@ -231,6 +214,8 @@ def run():
         st.subheader("📍 Selected Price Area")
         st.write(f"Lat: {st.session_state.last_pin[0]:.6f}")
         st.write(f"Lon: {st.session_state.last_pin[1]:.6f}")
+        cell_lat, cell_lon = get_weather_cell(*st.session_state.last_pin)
+        st.caption(f"Weather (ERA5) grid cell: {cell_lat:.2f}, {cell_lon:.2f}")
 
         if st.session_state.selected_feature_id is None:
             st.write("Outside known features.")
@@ -3,7 +3,7 @@ import plotly.express as px
 import pandas as pd
 import numpy as np
 
-from tools.utils import load_data_fromAPI
+from tools.utils import load_weather_range, get_weather_cell
 from tools.Snow_drift import compute_snow_transport, compute_average_sector, plot_rose
 
 
@@ -28,6 +28,8 @@ def run():
 
     st.write(f"**Area:** {area_name}")
     st.write(f"**Coordinates:** {lat:.4f}, {lon:.4f}")
+    cell_lat, cell_lon = get_weather_cell(lat, lon)
+    st.write(f"**Weather grid cell (ERA5 0.25°):** {cell_lat:.2f}, {cell_lon:.2f}")
 
     # --------------------- Select snow-year range---------------------
     def season_label(s):
@@ -61,18 +63,16 @@ def run():
     results = []
     season_dfs = {}
 
+    # One request covers every selected snow year (Jul of the first → Jun of the last)
+    with st.spinner(f"Loading weather {start_season}-07-01 → {end_season + 1}-06-30 ..."):
+        df = load_weather_range(lon, lat, f"{start_season}-07-01", f"{end_season + 1}-06-30")
+
     for season in range(start_season, end_season + 1):
 
         year1 = season
         year2 = season + 1
 
         with st.spinner(f"Processing {season_label(season)} ..."):
-            df_y1 = load_data_fromAPI(lon, lat, year1)
-            df_y2 = load_data_fromAPI(lon, lat, year2)
-
-            df = pd.concat([df_y1, df_y2], ignore_index=True)
-            df.sort_values("date", inplace=True)
-
             # Slice the snow-year: July → June
             season_start = pd.Timestamp(year1, 7, 1, tz="Europe/Oslo")
             season_end   = pd.Timestamp(year2, 6, 30, 23, 59, tz="Europe/Oslo")
@@ -4,13 +4,14 @@ import pymongo
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from tools.utils import get_elhub_data
+from tools.utils import get_energy_cube, rollup_totals
 
 
-def render_energy_page(df, mode):
+def render_energy_page(cube, mode, start_dt, end_dt):
     """
     mode = "Production" or "Consumption"
-    df   = df_prod or df_cons
+    cube = EnergyCube of the dataset (area × group × hour)
+    start_dt, end_dt = time range of the pie chart totals (aggregated in MongoDB)
     """
 
     #  -------------------Choose the group column based on mode  -------------------
@@ -28,8 +29,8 @@ def render_energy_page(df, mode):
 
         price_area = st.session_state.expl_price_area
 
-        df_area = df[df["pricearea"] == price_area]
-        df_sum = df_area.groupby(group_col)["quantitykwh"].sum().reset_index()
+        # Totals per group come from the yearly rollups (one document per group)
+        df_sum = rollup_totals(mode, start_dt, end_dt, areas=price_area, by=("group",))
 
         fig1 = px.pie(
             df_sum,
@@ -58,10 +59,11 @@ def render_energy_page(df, mode):
         st.markdown(f"#### 2. Hourly {mode} Trend")
 
         # group selector
+        groups = sorted(cube.groups_with_data())
         group = st.pills(
             "Select Group",
-            options=sorted(df[group_col].unique()),
-            default=[sorted(df[group_col].unique())[0]],
+            options=groups,
+            default=groups[:1],
             key=f"group_{mode}",
             selection_mode="single",
         )
@@ -72,19 +74,14 @@ def render_energy_page(df, mode):
             key=f"month_{mode}"
         )
 
-        df_month = df[
-            (df["pricearea"] == price_area)
-            & (df[group_col] == group)
-            & (pd.to_datetime(df["starttime"]).dt.month == month)
-        ]
-
-        df_month = df_month.sort_values("starttime")
+        # The month is a slice of the cube's time axis, the series a view of one area/group row
+        y = cube.series(price_area, group, cube.month_slice(f"{start_dt.year}-{month:02d}"))
 
         fig2 = go.Figure()
         fig2.add_trace(
             go.Scatter(
-                x=pd.to_datetime(df_month["starttime"]),
-                y=df_month["quantitykwh"],
+                x=y.index,
+                y=y.values,
                 mode="lines+markers",
                 name=group,
             )
@@ -114,16 +111,17 @@ def run():
     start_dt = pd.Timestamp(f"{year}-01-01")
     end_dt   = pd.Timestamp(f"{year}-12-31")
 
-    df_prod, df_cons = get_elhub_data(start_dt, end_dt)
+    cube_prod = get_energy_cube("Production", start_dt, end_dt)
+    cube_cons = get_energy_cube("Consumption", start_dt, end_dt)
 
 
     # Tabs for Production & Consumption
     tab_prod, tab_cons = st.tabs(["📈 Production", "📉 Consumption"])
 
     with tab_prod:
-        render_energy_page(df_prod, mode="Production")
+        render_energy_page(cube_prod, mode="Production", start_dt=start_dt, end_dt=end_dt)
 
     with tab_cons:
-        render_energy_page(df_cons, mode="Consumption")
+        render_energy_page(cube_cons, mode="Consumption", start_dt=start_dt, end_dt=end_dt)
 
 
@@ -1,7 +1,6 @@
 import streamlit as st
 import plotly.express as px
-import pandas as pd
-from tools.utils import load_data_fromAPI,get_basic_info
+from tools.utils import load_weather_frame,get_basic_info,warm_price_area_weather
 
 def run():
 
@@ -28,15 +27,14 @@ def run():
     st.info(f"Current selection → Year: **{year}**, Price Area: **{price_area}**")
 
     # ------------------- Load weather from API -------------------
-    weather_df = load_data_fromAPI(longitude, latitude, selected_year=year)
+    # All five price areas are fetched together, so switching areas reads from the local store
+    warm_price_area_weather(year)
+    weather = load_weather_frame(longitude, latitude, f"{year}-01-01", f"{year}-12-31")
 
-    if weather_df is None or weather_df.empty:
+    if weather is None or len(weather) == 0:
         st.warning("No data returned for this location/year.")
         st.stop()
 
-    weather_df['date'] = pd.to_datetime(weather_df['date'])
-    weather_df["year_month"] = weather_df["date"].dt.strftime("%Y-%m")
-
 # ------------------- Two column layout for selectors -------------------
     col_left, col_right = st.columns([1.2, 2])
 
@@ -46,7 +44,7 @@ def run():
         st.markdown("#### 📌 Step 1: Choose a variable")
         option_meteo = st.selectbox(
             "",
-            options=weather_df.columns.drop(['date', 'year_month']).to_list() + ["Show all"],
+            options=weather.variables + ["Show all"],
             index=0
         )
 
@@ -55,7 +53,7 @@ def run():
         # Month selector
         st.markdown("#### ⏳ Step 2: Select time range")
 
-        month_list = sorted(weather_df['year_month'].unique())
+        month_list = weather.months
 
         start_month, end_month = st.select_slider(
             "",
@@ -72,18 +70,12 @@ def run():
 
     with col_right:
         # ------------------- Filter data -------------------
-        df_filtered = weather_df[
-            (weather_df['year_month'] >= start_month) &
-            (weather_df['year_month'] <= end_month)
-        ]
-
-        if option_meteo != "Show all":
-            df_plot = df_filtered[['date', option_meteo]]
-        else:
-            df_plot = df_filtered.drop(columns=['year_month'])
+        # Precomputed month offsets: the selection is a row slice of the cached arrays
+        rows = weather.month_slice(start_month, end_month)
 
         # ------------------- Plot -------------------
         if option_meteo != "Show all":
+            df_plot = weather.to_frame([option_meteo], rows)
             fig = px.line(
                 df_plot,
                 x="date",
@@ -91,7 +83,7 @@ def run():
                 title=f"{option_meteo} — {start_month} to {end_month}",
             )
         else:
-            df_melt = df_filtered.melt(id_vars="date", var_name="variable", value_name="value")
+            df_melt = weather.to_long(rows=rows)
             fig = px.line(
                 df_melt,
                 x="date",
@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-from tools.utils import load_data_fromAPI,get_basic_info
+from tools.utils import load_weather_frame,get_basic_info,warm_price_area_weather
 
 def run():
     # -------------------  Load data from API -------------------
@@ -14,9 +14,8 @@ def run():
     latitude = float(basic_info.loc[basic_info["city"] == selected_city, "latitude"].iloc[0])
     longitude = float(basic_info.loc[basic_info["city"] == selected_city, "longitude"].iloc[0])
 
-    weather_df = load_data_fromAPI(longitude, latitude, selected_year=selected_year)
-    # Keep data from the first month (January)
-    weather_df = weather_df[weather_df['date'].dt.month == 1]
+    warm_price_area_weather(selected_year)
+    weather = load_weather_frame(longitude, latitude, f"{selected_year}-01-01", f"{selected_year}-12-31")
 
     # Display information about the selected location
     price_area = basic_info.loc[
@@ -25,23 +24,25 @@ def run():
 
     st.success(f"Using data from **{selected_city}** corresponding to **{price_area}**")
 
-    if weather_df is None or weather_df.empty:
+    if weather is None or f"{selected_year}-01" not in weather.month_offsets:
         st.warning("No data returned for this location/year.")
         st.stop()
 
+    # Keep data from the first month (January): a view of the cached arrays
+    rows = weather.month_slice(f"{selected_year}-01")
+
     # -------------------  Create a small interactive visualization -------------------
 
-    for col in weather_df.columns:
-        if col != "date":
-            df_var = pd.DataFrame({
-                "Variable": [col],
-                "Series": [weather_df[col].tolist()]
-            })
-            st.data_editor(
-            df_var,
-            column_config={
-                "Variable": st.column_config.TextColumn(label="Variable", width="medium"),
-                "Series": st.column_config.LineChartColumn("Value",help=f"Row-wise sparkline for {col}",width="large"),
-            },
-            hide_index=True,
-            )
+    for col in weather.variables:
+        df_var = pd.DataFrame({
+            "Variable": [col],
+            "Series": [weather.column(col, rows).tolist()]
+        })
+        st.data_editor(
+        df_var,
+        column_config={
+            "Variable": st.column_config.TextColumn(label="Variable", width="medium"),
+            "Series": st.column_config.LineChartColumn("Value",help=f"Row-wise sparkline for {col}",width="large"),
+        },
+        hide_index=True,
+        )
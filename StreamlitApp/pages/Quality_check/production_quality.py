@@ -1,10 +1,10 @@
-from tools.utils import get_elhub_data, plot_stl_decompostion, plot_spectrogram
+from tools.utils import get_energy_cube, warm_stl, stl_decompose, stl_figure, plot_spectrogram, STL_DEFAULTS
 import streamlit as st
 import pandas as pd
 
 
 # --------------------  Production Data Quality-------------------- 
-def render_qc_production(df):
+def render_qc_production(cube):
 
     price_area = st.session_state.qc_price_area
 
@@ -14,21 +14,25 @@ def render_qc_production(df):
     with col_a:
         st.markdown("##### 📌 Step 1: Choose Production Group:")
     with col_b:
+        groups = sorted(cube.groups_with_data())
         group = st.pills(
             "",
-            options=sorted(df["productiongroup"].unique()),
-            default=[sorted(df["productiongroup"].unique())[0]],
+            options=groups,
+            default=groups[:1],
             key="qc_production_group",
             selection_mode="single",
         )
 
-    df_area = df[df["pricearea"] == price_area]
-
-    if df_area.empty:
+    if not cube.has_data(area=price_area):
         st.warning("No data available for this Price Area.")
         st.stop()
 
-    df_group = df_area[df_area["productiongroup"] == group].sort_values("starttime")
+    # One area/group row of the cube, as a time-indexed series
+    y = cube.series(price_area, group)
+
+    # Every area/group series of the year is decomposed with the default parameters in a process pool
+    # (in the background; already queued or cached series are skipped)
+    warm_stl(cube, **STL_DEFAULTS)
 
     # -------------------- 2. Two Tabs: STL / Spectrogram -------------------- #
     tab_stl, tab_spec = st.tabs(["📉 STL Decomposition", "🎧 Spectrogram"])
@@ -40,23 +44,17 @@ def render_qc_production(df):
 
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            period = st.number_input("Period", min_value=1, max_value=168, value=24, step=1)
+            period = st.number_input("Period", min_value=1, max_value=168, value=STL_DEFAULTS["period"], step=1)
         with col2:
-            seasonal = st.slider("Seasonal Window", min_value=3, max_value=241, value=41, step=2)
+            seasonal = st.slider("Seasonal Window", min_value=3, max_value=241, value=STL_DEFAULTS["seasonal"], step=2)
         with col3:
-            trend = st.slider("Trend Window", min_value=5, max_value=721, value=121, step=2)
+            trend = st.slider("Trend Window", min_value=5, max_value=721, value=STL_DEFAULTS["trend"], step=2)
         with col4:
-            robust = st.checkbox("Robust Mode", value=True)
+            robust = st.checkbox("Robust Mode", value=STL_DEFAULTS["robust"])
 
-        fig_stl = plot_stl_decompostion(
-            df_group,
-            area=price_area,
-            group=group,
-            period=period,
-            seasonal=seasonal,
-            trend=trend,
-            robust=robust
-        )
+        # Cached components (a parameter change fits only this series), then the figure
+        components = stl_decompose(y, period=period, seasonal=seasonal, trend=trend, robust=robust)
+        fig_stl = stl_figure(y, components, area=price_area, group=group)
 
         if fig_stl:
             st.plotly_chart(fig_stl, use_container_width=True)
@@ -73,7 +71,7 @@ def render_qc_production(df):
             noverlap = st.slider("Overlap (hours)", min_value=0, max_value=120, value=20, step=5)
 
         fig_spec = plot_spectrogram(
-            df_group,
+            y,
             area=price_area,
             group=group,
             nperseg=nperseg,
@@ -100,10 +98,10 @@ def run():
     start_dt = pd.Timestamp(f"{year}-01-01")
     end_dt = pd.Timestamp(f"{year}-12-31")
 
-    df_prod, _ = get_elhub_data(start_dt=start_dt, end_dt=end_dt)
+    cube = get_energy_cube("Production", start_dt, end_dt)
 
-    if df_prod.empty:
+    if not cube.has_data():
         st.warning("No production data found for selected year.")
         return
 
-    render_qc_production(df_prod)
\ No newline at end of file
+    render_qc_production(cube)
\ No newline at end of file
@@ -2,12 +2,25 @@ import streamlit as st
 import pandas as pd
 from tools.utils import (
     load_data_fromAPI,
+    warm_price_area_weather,
     get_basic_info,
+    WEATHER_VARIABLES,
     plot_outlier_detection_dct,
-    plot_outlier_detection_lof
+    spc_sensitivity,
+    plot_spc_sensitivity,
+    spc_fleet,
+    refresh_weather_tail,
+    live_weather_outliers,
+    plot_outlier_detection_lof,
+    joint_lof,
+    plot_joint_lof,
 )
 
 
+# Years offered by the Quality Check sidebar, swept together by the fleet overview
+QC_YEARS = (2021, 2022, 2023, 2024)
+
+
 # -------------------- Weather QC page (SPC + LOF)-------------------- 
 def run():
 
@@ -42,25 +55,28 @@ def run():
         f"- Longitude: {lon:.4f}\n\n"
         "Note: Price areas cover large regions; This analysis uses one fixed point within the area."
     )
-    weather_df = load_data_fromAPI(lon, lat, selected_year=year)
-    weather_df["date"] = pd.to_datetime(weather_df["date"])
-
-    if weather_df.empty:
-        st.warning("No weather data available.")
-        st.stop()
-
     # -------------------- Step 1: Select variable -------------------- #
     st.markdown("##### 📌 Step 1: Choose weather variable")
     variable = st.selectbox(
         "",
-        options=list(weather_df.columns.drop("date")),
+        options=WEATHER_VARIABLES,
         key="qc_weather_var"
     )
 
+    # All five price areas are fetched together, so switching areas reads from the local store
+    warm_price_area_weather(year)
+    # Only the selected variable is read from the store
+    weather_df = load_data_fromAPI(lon, lat, selected_year=year, variables=[variable])
+    weather_df["date"] = pd.to_datetime(weather_df["date"])
+
+    if weather_df.empty:
+        st.warning("No weather data available.")
+        st.stop()
+
     df_var = weather_df[["date", variable]].copy()
 
     # -------------------- Step 2: Two tabs (SPC / LOF) -------------------- #
-    tab_spc, tab_lof = st.tabs(["📉 SPC (DCT High-pass) Outliers", "🔍 LOF Anomaly Detection"])
+    tab_spc, tab_lof, tab_joint = st.tabs(["📉 SPC (DCT High-pass) Outliers", "🔍 LOF Anomaly Detection", "🧭 Joint LOF (multivariate)"])
 
 
     # -------------------- TAB 1 — SPC / DCT BASED HIGH-PASS OUTLIER DETECTION -------------------- 
@@ -100,6 +116,32 @@ def run():
             colB.metric("Outliers", summary_spc["num_outliers"])
             colC.metric("Outlier Rate (%)", summary_spc["ratio_outlier"])
 
+            # Outlier rates over a grid of k values and cutoffs, from the cached spectrum
+            sensitivity = spc_sensitivity(df_var[variable].to_numpy(float), W_filter)
+            st.plotly_chart(plot_spc_sensitivity(sensitivity, W_filter, coef_k), use_container_width=True)
+
+        # Hours flagged by the streaming SPC when new hours of this location were appended.
+        # Expander bodies run even when collapsed, so the current year is only fetched on request
+        with st.expander("📡 Live feed: flagged new hours (streaming SPC)"):
+            if st.checkbox("Check for new hours", key="qc_live_feed"):
+                refresh_weather_tail(lon, lat, variables=[variable])
+                live_outliers = live_weather_outliers(lon, lat)
+                if live_outliers.empty:
+                    st.caption("No flagged hours among the hours appended since the app started.")
+                else:
+                    st.dataframe(live_outliers.iloc[::-1], use_container_width=True, hide_index=True)
+
+        # Same detector and parameters for every price area, variable and year in one batched pass
+        with st.expander("🗺 SPC overview: all price areas, variables and years"):
+            if st.button("Run SPC for all series", key="qc_spc_fleet"):
+                fleet_summary, fleet_outliers = spc_fleet(QC_YEARS, W_filter=W_filter, coef_k=coef_k)
+                st.dataframe(
+                    fleet_summary.pivot_table(index=["price_area", "variable"], columns="year", values="ratio_outlier"),
+                    use_container_width=True,
+                )
+                st.caption("Outlier rate (%) per series. Outlier hours:")
+                st.dataframe(fleet_outliers, use_container_width=True, hide_index=True)
+
 
     # -------------------- TAB 2 — LOF ANOMALY DETECTION-------------------- 
 
@@ -132,3 +174,45 @@ def run():
             colA.metric("Samples", summary_lof["num_sample"])
             colB.metric("Outliers", summary_lof["num_outliers"])
             colC.metric("Outlier Rate (%)", summary_lof["ratio_outlier"])
+
+
+    # -------------------- TAB 3 — JOINT (MULTIVARIATE) LOF OVER SEVERAL YEARS-------------------- 
+
+    with tab_joint:
+        st.markdown("##### 📌 Step 2: Choose variables, years and LOF parameters")
+
+        joint_variables = st.multiselect(
+            "Variables (standardised)",
+            options=WEATHER_VARIABLES,
+            default=["wind_speed_10m", "wind_gusts_10m"],
+            key="qc_joint_variables"
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            # Any stored or fetchable year: up to the current one (partial), at least the sidebar's years
+            last_year = max(pd.Timestamp.now(tz="Europe/Oslo").year, *QC_YEARS)
+            joint_years = st.slider("Years", min_value=1990, max_value=last_year, value=(year, year), key="qc_joint_years")
+            joint_contamination = st.slider("Outlier proportion", 0.001, 0.1, 0.01, step=0.005, key="qc_joint_contamination")
+        with col2:
+            joint_neighbors = st.slider("Number of neighbors", 5, 100, 50, step=5, key="qc_joint_neighbors")
+            approximate = st.checkbox(
+                "Approximate neighbours (faster for long records)",
+                value=joint_years[1] - joint_years[0] >= 10,
+                key="qc_joint_approximate"
+            )
+
+        if len(joint_variables) < 2:
+            st.info("Select at least two variables.")
+        else:
+            joint_table = joint_lof(
+                lon, lat, joint_years[0], joint_years[1], joint_variables,
+                contamination=joint_contamination, n_neighbors=joint_neighbors, approximate=approximate
+            )
+            st.plotly_chart(plot_joint_lof(joint_table, joint_variables), use_container_width=True)
+
+            joint_outliers = joint_table[joint_table["outlier"]].sort_values("lof_score", ascending=False)
+            colA, colB, colC = st.columns(3)
+            colA.metric("Samples", int(joint_table["lof_score"].notna().sum()))
+            colB.metric("Outliers", len(joint_outliers))
+            colC.metric("Outlier Rate (%)", round(len(joint_outliers) / max(len(joint_table), 1) * 100, 2))
+            st.dataframe(joint_outliers, use_container_width=True, hide_index=True)
@@ -0,0 +1,200 @@
+"""
+Offline benchmark of the weather code paths (snow drift, QC, correlation, forecasting)
+and of the Elhub energy loaders.
+
+Weather comes from an offline provider, so the timings measure compute latency only
+(or compute + local HTTP/JSON decoding with --standin), independent of the real API.
+Energy data comes from synthetic Parquet files (tools/elhub_synthetic.py) unless
+--elhub-backend names another backend, so backends can be compared on the same queries.
+
+Usage (from the StreamlitApp folder):
+    python -m tools.benchmark --provider csv
+    python -m tools.benchmark --provider synthetic --years 2019 2023 --repeat 5
+    python -m tools.benchmark --standin
+    python -m tools.benchmark --elhub-backend mongo     # energy loaders against MongoDB (secrets.toml)
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+
+from tools import weather_store
+from tools.weather_provider import set_weather_provider
+from tools.elhub_backend import set_elhub_backend
+from tools.elhub_synthetic import write_parquet
+from tools.energy_cube import EnergyCube
+from tools.Snow_drift import compute_snow_transport, compute_average_sector
+from tools.utils import (
+    _load_weather_range,
+    _elhub_chunk_cache,
+    _aggregate_energy,
+    get_elhub_data,
+    aggregate_energy,
+    load_weather_range,
+    load_data_fromAPI,
+    plot_outlier_detection_dct,
+    plot_outlier_detection_lof,
+    plot_lag_window_center,
+)
+
+OSLO = (59.9127, 10.7461)
+
+
+def timed(label, func, repeat, results):
+    """Run func `repeat` times and record min/median wall time in ms."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    results.append({"step": label, "min_ms": round(min(times), 2), "median_ms": round(statistics.median(times), 2)})
+
+
+def bench_load(start_year, end_year, repeat, results):
+    lat, lon = OSLO
+
+    def cold():
+        # empty store + empty memory cache: provider fetch, decode, write, read
+        weather_store.STORE_DIR = Path(tempfile.mkdtemp())
+        _load_weather_range.clear()
+        load_weather_range(lon, lat, f"{start_year}-01-01", f"{end_year}-12-31")
+
+    def warm_store():
+        # store populated, memory cache cleared: memory-mapped Parquet reads only
+        _load_weather_range.clear()
+        load_weather_range(lon, lat, f"{start_year}-01-01", f"{end_year}-12-31")
+
+    timed(f"load {start_year}-{end_year} (cold)", cold, repeat, results)
+    timed(f"load {start_year}-{end_year} (store)", warm_store, repeat, results)
+
+
+def bench_snow_drift(start_year, end_year, repeat, results):
+    lat, lon = OSLO
+    df = load_weather_range(lon, lat, f"{start_year}-07-01", f"{end_year}-06-30")
+
+    def run():
+        for season in range(start_year, end_year):
+            season_start = pd.Timestamp(season, 7, 1, tz="Europe/Oslo")
+            season_end = pd.Timestamp(season + 1, 6, 30, 23, 59, tz="Europe/Oslo")
+            df_season = df[(df["date"] >= season_start) & (df["date"] <= season_end)].copy()
+            df_season["Swe"] = np.where(df_season["temperature_2m"] < 1, df_season["precipitation"], 0)
+            compute_snow_transport(3000, 30000, 0.5, df_season["Swe"].sum(), df_season["wind_speed_10m"].tolist())
+            compute_average_sector(df_season)
+
+    timed(f"snow drift {start_year}-{end_year}", run, repeat, results)
+
+
+def bench_quality(year, repeat, results):
+    lat, lon = OSLO
+    df = load_data_fromAPI(lon, lat, year)
+    df_var = df[["date", "temperature_2m"]].copy()
+
+    timed(f"SPC/DCT {year}", lambda: plot_outlier_detection_dct(df_var, "temperature_2m"), repeat, results)
+    timed(f"LOF {year}", lambda: plot_outlier_detection_lof(df_var, "temperature_2m"), repeat, results)
+
+
+def bench_correlation(year, repeat, results):
+    lat, lon = OSLO
+    df = load_data_fromAPI(lon, lat, year)
+    x = df[df["date"].dt.month == 1].reset_index(drop=True)
+    # Synthetic energy series with a daily cycle, aligned to the weather hours
+    hours = np.arange(len(x))
+    y = pd.Series(1000 + 200 * np.sin(2 * np.pi * hours / 24), index=x["date"].dt.tz_localize(None))
+
+    timed(f"correlation {year}-01", lambda: plot_lag_window_center(x, y, "temperature_2m", 48, 72, 177), repeat, results)
+
+
+def bench_forecasting(year, repeat, results):
+    lat, lon = OSLO
+    df = load_weather_range(lon, lat, f"{year}-01-01", f"{year}-04-30")
+    exog = df.set_index("date")[["temperature_2m"]].resample("D").mean()
+    y = pd.Series(5000 - 50 * exog["temperature_2m"].to_numpy(), index=exog.index)
+
+    def run():
+        model = sm.tsa.statespace.SARIMAX(
+            y.iloc[:90], exog=exog.iloc[:90], order=(1, 0, 0), seasonal_order=(1, 0, 1, 7),
+            enforce_stationarity=False, enforce_invertibility=False,
+        )
+        model.fit(disp=False).get_forecast(steps=7, exog=exog.iloc[90:97])
+
+    timed(f"forecasting {year} (90 days)", run, repeat, results)
+
+
+def bench_energy(start_year, end_year, repeat, results):
+    start, end = f"{start_year}-01-01", f"{end_year}-12-31"
+
+    def cold():
+        _elhub_chunk_cache().clear()
+        get_elhub_data(start, end)
+
+    timed(f"energy rows {start_year}-{end_year} (cold)", cold, repeat, results)
+    timed(f"energy rows {start_year}-{end_year} (cached)", lambda: get_elhub_data(start, end), repeat, results)
+
+    df_prod, _ = get_elhub_data(start, end)
+
+    def area_means_backend():
+        _aggregate_energy.clear()
+        # Monthly sums per area on the backend, then their mean: one row per price area is transferred
+        aggregate_energy("Production", start, end, groups="hydro", granularity="M", by=("pricearea",), then_mean=True)
+
+    def daily_series():
+        _aggregate_energy.clear()
+        aggregate_energy("Consumption", start, end, areas="NO1", groups="household", granularity="D",
+                         by=(), unique_hours=True)
+
+    cube = EnergyCube.from_frame(df_prod, "productiongroup")
+    timed(f"energy cube build {start_year}-{end_year}", lambda: EnergyCube.from_frame(df_prod, "productiongroup"), repeat, results)
+    timed("month series (frame masks)", lambda: df_prod[
+        (df_prod["pricearea"] == "NO1") & (df_prod["productiongroup"] == "hydro")
+        & (df_prod["starttime"].dt.year == start_year) & (df_prod["starttime"].dt.month == 1)
+    ], repeat, results)
+    timed("month series (cube)",
+          lambda: cube.series("NO1", "hydro", cube.month_slice(f"{start_year}-01")), repeat, results)
+    timed("area means, monthly (backend)", area_means_backend, repeat, results)
+    timed("daily series (backend)", daily_series, repeat, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the weather code paths")
+    parser.add_argument("--provider", choices=["csv", "synthetic"], default="csv")
+    parser.add_argument("--standin", action="store_true", help="serve the provider through the local HTTP stand-in")
+    parser.add_argument("--years", nargs=2, type=int, default=[2021, 2024], metavar=("START", "END"))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--elhub-backend", default=None,
+                        help='"mongo" or "parquet:<folder>" (default: synthetic data in a temporary folder)')
+    args = parser.parse_args()
+
+    server = None
+    if args.standin:
+        from tools.openmeteo_standin import start_server
+        server = start_server(args.provider, port=0)
+        set_weather_provider(f"http://127.0.0.1:{server.server_address[1]}")
+    else:
+        set_weather_provider(args.provider)
+
+    start_year, end_year = args.years
+    if args.elhub_backend is None:
+        store = tempfile.mkdtemp()
+        write_parquet(store, ["Production", "Consumption"],
+                      list(pd.period_range(f"{start_year}-01", f"{end_year}-12", freq="M")))
+        set_elhub_backend(f"parquet:{store}")
+    else:
+        set_elhub_backend(args.elhub_backend)
+
+    results = []
+    bench_load(start_year, end_year, args.repeat, results)
+    bench_snow_drift(start_year, end_year, args.repeat, results)
+    bench_quality(start_year, args.repeat, results)
+    bench_correlation(start_year, args.repeat, results)
+    bench_forecasting(start_year, args.repeat, results)
+    bench_energy(start_year, end_year, args.repeat, results)
+
+    if server is not None:
+        server.shutdown()
+    print(pd.DataFrame(results).to_string(index=False))
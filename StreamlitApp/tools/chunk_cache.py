@@ -0,0 +1,85 @@
+"""
+Byte-bounded LRU cache for DataFrame chunks, shared by all sessions of a worker.
+
+Entries are evicted least-recently-used first once the total size exceeds `max_bytes`.
+An entry can carry an expiry time (for chunks that may still change, e.g. the current month).
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def frame_nbytes(value):
+    """Approximate in-memory size of a cached value."""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        size = value.memory_usage(index=True, deep=True)
+        return int(size.sum()) if isinstance(size, pd.Series) else int(size)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sum(frame_nbytes(v) for v in value)
+    if isinstance(value, dict):
+        return sum(frame_nbytes(v) for v in value.values())
+    return int(getattr(value, "nbytes", 0))
+
+
+class ChunkCache:
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries = OrderedDict()   # key -> (value, nbytes, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key):
+        """Cached value of key (marked as most recently used), or None when absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, nbytes, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.nbytes -= nbytes
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        """Store value under key; `ttl` (seconds) makes the entry expire."""
+        nbytes = frame_nbytes(value)
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            self._entries[key] = (value, nbytes, expires_at)
+            self.nbytes += nbytes
+            # Evict the least recently used entries, but always keep the newest one
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                _, (_, evicted_bytes, _) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_bytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {"entries": len(self._entries), "nbytes": self.nbytes, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,364 @@
+"""
+Storage backends behind get_elhub_data and the aggregation helpers.
+
+Every backend serves the same contract:
+ - load_months(mode, months): hourly rows of whole (local calendar) months as a frame with
+   starttime (datetime64), pricearea and the group column (categorical) and quantitykwh (float64)
+ - aggregate(mode, start_dt, end_dt, ...): the aggregated rows of aggregate_energy
+ - rollup_rows(mode, start_dt, end_dt, granularity, ...): pre-aggregated rows, or None when the
+   backend has no rollups covering the range (callers then aggregate)
+
+Backends:
+ - "mongo" (default): the elhub_db collections (raw BSON batch decoding, $match/$group pipelines, rollups)
+ - "parquet" or "parquet:<folder>": one Parquet file per dataset and month, for offline runs and profiling
+
+The backend is selected with the ELHUB_BACKEND environment variable (or st.secrets["elhub"]["backend"]).
+"""
+
+import os
+from pathlib import Path
+
+import bson
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson.codec_options import CodecOptions, DatetimeConversion
+
+from tools.elhub_rollups import ELHUB_COLLECTIONS, period_expression, covered_months, read_rollups
+
+PARQUET_DIR = Path(__file__).resolve().parent.parent / "data" / "elhub_store"
+DEFAULT_BACKEND = "mongo"
+
+_REDUCERS = {"sum": "$sum", "mean": "$avg", "max": "$max", "min": "$min"}
+_PANDAS_REDUCERS = {"sum": "sum", "mean": "mean", "max": "max", "min": "min"}
+
+
+def as_list(value):
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+def day_window(start_dt, end_dt):
+    """First and last instant of the whole days start_dt..end_dt."""
+    start_dt = pd.Timestamp(start_dt).normalize()
+    end_dt = pd.Timestamp(end_dt).normalize() + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    return start_dt, end_dt
+
+
+def output_columns(mode, by, granularity, then_mean):
+    """Columns of an aggregation result: the `by` fields (group renamed), `period`, `quantitykwh`."""
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    columns = [group_field if name == "group" else name for name in by]
+    if granularity is not None and not then_mean:
+        columns.append("period")
+    return columns + ["quantitykwh"]
+
+
+class ElhubBackend:
+    """Base class: subclasses implement load_months and aggregate, and rollup_rows when they keep rollups."""
+
+    name = "base"
+
+    def load_months(self, mode, months):
+        raise NotImplementedError
+
+    def aggregate(self, mode, start_dt, end_dt, areas=None, groups=None, granularity=None,
+                  by=("pricearea", "group"), agg="sum", then_mean=False, unique_hours=False):
+        raise NotImplementedError
+
+    def rollup_rows(self, mode, start_dt, end_dt, granularity, areas=None, groups=None):
+        return None
+
+
+# ---------------------------------------------------------------------------- MongoDB
+
+# Datetimes are decoded as integer milliseconds instead of datetime objects
+_RAW_CODEC = CodecOptions(datetime_conversion=DatetimeConversion.DATETIME_MS)
+
+
+def _category_code(categories, value):
+    """Integer code of a category value, adding new values as they appear (-1 for missing)."""
+    if value is None:
+        return -1
+    return categories.setdefault(value, len(categories))
+
+
+def load_energy_columns(collection, group_field, query, batch_size=50_000):
+    """
+    Load only starttime, pricearea, group and quantitykwh of the matching documents.
+    The cursor is read as raw BSON batches. Each batch is decoded (bson.decode_all, with datetimes
+    as integer milliseconds) and its values are copied into typed columns (int64 times, float64
+    quantities, categorical codes), so only one batch of dicts is alive at a time, never a list
+    for the whole result. The columns grow geometrically, without counting the documents first.
+    """
+    projection = {"_id": 0, "starttime": 1, "pricearea": 1, group_field: 1, "quantitykwh": 1}
+    capacity = batch_size
+    starttime = np.empty(capacity, dtype=np.int64)
+    quantity = np.empty(capacity, dtype=np.float64)
+    area_codes = np.empty(capacity, dtype=np.int16)
+    group_codes = np.empty(capacity, dtype=np.int16)
+    areas, groups = {}, {}
+
+    n = 0
+    for raw_batch in collection.find_raw_batches(query, projection, batch_size=batch_size):
+        docs = bson.decode_all(raw_batch, _RAW_CODEC)
+        k = len(docs)
+        if n + k > capacity:
+            capacity = max(n + k, 2 * capacity)
+            for column in (starttime, quantity, area_codes, group_codes):
+                column.resize(capacity, refcheck=False)
+        rows = slice(n, n + k)
+        starttime[rows] = np.fromiter((int(d["starttime"]) for d in docs), np.int64, k)
+        quantity[rows] = np.fromiter(
+            (np.nan if d.get("quantitykwh") is None else d["quantitykwh"] for d in docs), np.float64, k
+        )
+        area_codes[rows] = np.fromiter((_category_code(areas, d.get("pricearea")) for d in docs), np.int16, k)
+        group_codes[rows] = np.fromiter((_category_code(groups, d.get(group_field)) for d in docs), np.int16, k)
+        n += k
+
+    return pd.DataFrame({
+        "starttime": starttime[:n].astype("datetime64[ms]").astype("datetime64[ns]"),
+        "pricearea": pd.Categorical.from_codes(area_codes[:n], categories=list(areas)),
+        group_field: pd.Categorical.from_codes(group_codes[:n], categories=list(groups)),
+        "quantitykwh": quantity[:n],
+    })
+
+
+def sort_by_time(df):
+    """The frame sorted by starttime (stable: rows of the same hour keep their order); unchanged when already sorted."""
+    if df.empty or df["starttime"].is_monotonic_increasing:
+        return df
+    return df.sort_values("starttime", kind="stable", ignore_index=True)
+
+
+def month_range_query(months):
+    """Filter of the hourly documents of a run of consecutive months (MongoBackend.load_months)."""
+    return {
+        "starttime": {
+            "$gte": months[0].start_time.to_pydatetime(),
+            "$lt": (months[-1] + 1).start_time.to_pydatetime(),
+        }
+    }
+
+
+def build_energy_pipeline(mode, start_dt, end_dt, areas=None, groups=None, granularity=None,
+                          by=("pricearea", "group"), agg="sum", then_mean=False, unique_hours=False):
+    """
+    Aggregation pipeline over one Elhub collection:
+     - $match on the time range (whole days, like get_elhub_data) and optionally price areas / groups
+     - $group by the `by` fields ("pricearea", "group") and, with `granularity` ("H", "D", "M" or "Y"),
+       by period, reducing `quantitykwh` with `agg` ("sum", "mean", "max" or "min")
+     - with `then_mean`, a second $group averaging the per-period values over the periods
+    `unique_hours` keeps one document per area/group/hour first (the pages' drop_duplicates on starttime).
+    """
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    fields = {"pricearea": "$pricearea", "group": f"${group_field}"}
+    start_dt, end_dt = day_window(start_dt, end_dt)
+
+    match = {"starttime": {"$gte": start_dt.to_pydatetime(), "$lte": end_dt.to_pydatetime()}}
+    if areas is not None:
+        match["pricearea"] = {"$in": as_list(areas)}
+    if groups is not None:
+        match[group_field] = {"$in": as_list(groups)}
+    pipeline = [{"$match": match}]
+
+    if unique_hours:
+        pipeline.append({"$group": {
+            "_id": {"pricearea": "$pricearea", "group": f"${group_field}", "starttime": "$starttime"},
+            "quantitykwh": {"$first": "$quantitykwh"},
+        }})
+        pipeline.append({"$replaceRoot": {"newRoot": {
+            "pricearea": "$_id.pricearea", group_field: "$_id.group",
+            "starttime": "$_id.starttime", "quantitykwh": "$quantitykwh",
+        }}})
+
+    key = {name: fields[name] for name in by}
+    if granularity is not None:
+        key["period"] = period_expression(granularity)
+    pipeline.append({"$group": {"_id": key, "quantitykwh": {_REDUCERS[agg]: "$quantitykwh"}}})
+
+    if then_mean:
+        pipeline.append({"$group": {
+            "_id": {name: f"$_id.{name}" for name in by},
+            "quantitykwh": {"$avg": "$quantitykwh"},
+        }})
+    sort_keys = list(by) if then_mean else list(key)
+    if sort_keys:
+        pipeline.append({"$sort": {f"_id.{name}": 1 for name in sort_keys}})
+    return pipeline
+
+
+class MongoBackend(ElhubBackend):
+    """The elhub_db collections. `connect` returns the (pooled) MongoClient and is called on first use."""
+
+    name = "mongo"
+
+    def __init__(self, connect, database="elhub_db"):
+        self._connect = connect
+        self.database = database
+
+    @property
+    def db(self):
+        return self._connect()[self.database]
+
+    def load_months(self, mode, months):
+        collection, group_field = ELHUB_COLLECTIONS[mode]
+        return load_energy_columns(self.db[collection], group_field, month_range_query(months))
+
+    def aggregate(self, mode, start_dt, end_dt, areas=None, groups=None, granularity=None,
+                  by=("pricearea", "group"), agg="sum", then_mean=False, unique_hours=False):
+        collection, group_field = ELHUB_COLLECTIONS[mode]
+        pipeline = build_energy_pipeline(mode, start_dt, end_dt, areas, groups, granularity, by, agg, then_mean, unique_hours)
+        cursor = self.db[collection].aggregate(pipeline, allowDiskUse=True)
+        rows = [{**(doc["_id"] or {}), "quantitykwh": doc["quantitykwh"]} for doc in cursor]
+
+        df = pd.DataFrame(rows).rename(columns={"group": group_field})
+        df = df.reindex(columns=output_columns(mode, by, granularity, then_mean))
+        if "period" in df.columns:
+            df["period"] = pd.to_datetime(df["period"])
+        return df
+
+    def rollup_rows(self, mode, start_dt, end_dt, granularity, areas=None, groups=None):
+        db = self.db
+        months = [str(month) for month in pd.period_range(start_dt, end_dt, freq="M")]
+        if len(covered_months(db, mode, months)) < len(months):
+            return None
+        return read_rollups(db, mode, granularity, start_dt, end_dt, as_list(areas), as_list(groups))
+
+
+# ---------------------------------------------------------------------------- Parquet
+
+def _period_start(starttime, granularity):
+    """Start of the hour/day/month/year of each timestamp (the pandas twin of period_expression)."""
+    if granularity == "H":
+        return starttime.dt.floor("h")
+    if granularity == "D":
+        return starttime.dt.normalize()
+    return starttime.dt.to_period(granularity).dt.start_time
+
+
+def aggregate_frame(df, mode, start_dt, end_dt, areas=None, groups=None, granularity=None,
+                    by=("pricearea", "group"), agg="sum", then_mean=False, unique_hours=False):
+    """build_energy_pipeline evaluated in pandas on hourly rows (same filters, grouping and output)."""
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    columns = output_columns(mode, by, granularity, then_mean)
+    start_dt, end_dt = day_window(start_dt, end_dt)
+
+    mask = (df["starttime"] >= start_dt) & (df["starttime"] <= end_dt)
+    if areas is not None:
+        mask &= df["pricearea"].isin(as_list(areas))
+    if groups is not None:
+        mask &= df[group_field].isin(as_list(groups))
+    df = df[mask]
+    if unique_hours:
+        df = df.drop_duplicates(subset=["pricearea", group_field, "starttime"])
+    if df.empty:
+        return pd.DataFrame(columns=columns)
+
+    keys = [group_field if name == "group" else name for name in by]
+    if granularity is not None:
+        df = df.assign(period=_period_start(df["starttime"], granularity))
+        keys.append("period")
+    if not keys:
+        return pd.DataFrame({"quantitykwh": [df["quantitykwh"].agg(_PANDAS_REDUCERS[agg])]})
+
+    result = df.groupby(keys, observed=True)["quantitykwh"].agg(_PANDAS_REDUCERS[agg])
+    if then_mean:
+        outer = keys[:-1] if granularity is not None else keys
+        result = result.groupby(level=outer, observed=True).mean() if outer else pd.Series([result.mean()], name="quantitykwh")
+    result = result.reset_index()
+    for column in result.columns:
+        if isinstance(result[column].dtype, pd.CategoricalDtype):
+            result[column] = result[column].astype(object)
+    # sorted by value like the pipeline's $sort (categories are in order of appearance)
+    sort_keys = columns[:-1]
+    if sort_keys:
+        result = result.sort_values(sort_keys, ignore_index=True)
+    return result.reindex(columns=columns)
+
+
+class ParquetBackend(ElhubBackend):
+    """
+    Local store with one file per dataset and month:
+
+        <root>/<collection>/month=<YYYY-MM>.parquet
+
+    (starttime, pricearea, group, quantitykwh; dictionary-encoded text columns).
+    Aggregations are computed in pandas from the monthly files; there are no rollups.
+    """
+
+    name = "parquet"
+
+    def __init__(self, root=PARQUET_DIR):
+        self.root = Path(root)
+
+    def month_path(self, mode, month):
+        collection, _ = ELHUB_COLLECTIONS[mode]
+        return self.root / collection / f"month={month}.parquet"
+
+    def write_month(self, mode, month, df):
+        """Write one month atomically (temporary file + rename)."""
+        _, group_field = ELHUB_COLLECTIONS[mode]
+        path = self.month_path(mode, month)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df = df[["starttime", "pricearea", group_field, "quantitykwh"]].reset_index(drop=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        pq.write_table(table, tmp_path, use_dictionary=["pricearea", group_field])
+        os.replace(tmp_path, path)
+
+    def load_months(self, mode, months):
+        _, group_field = ELHUB_COLLECTIONS[mode]
+        paths = [self.month_path(mode, month) for month in months]
+        tables = [pq.read_table(path, memory_map=True) for path in paths if path.exists()]
+        if not tables:
+            return pd.DataFrame({
+                "starttime": pd.Series(dtype="datetime64[ns]"),
+                "pricearea": pd.Categorical([]),
+                group_field: pd.Categorical([]),
+                "quantitykwh": pd.Series(dtype="float64"),
+            })
+        table = pa.concat_tables(tables).unify_dictionaries()
+        df = table.to_pandas()
+        for column in ("pricearea", group_field):
+            if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype("category")
+        df["starttime"] = df["starttime"].astype("datetime64[ns]")
+        return df
+
+    def aggregate(self, mode, start_dt, end_dt, areas=None, groups=None, granularity=None,
+                  by=("pricearea", "group"), agg="sum", then_mean=False, unique_hours=False):
+        months = list(pd.period_range(pd.Timestamp(start_dt), pd.Timestamp(end_dt), freq="M"))
+        df = self.load_months(mode, months)
+        return aggregate_frame(df, mode, start_dt, end_dt, areas, groups, granularity, by, agg, then_mean, unique_hours)
+
+
+_BACKENDS = {}
+
+
+def get_elhub_backend(spec=None, connect=None):
+    """
+    Return the backend named by `spec` (default: $ELHUB_BACKEND or "mongo"), built once per process.
+    `connect` returns the MongoClient for the "mongo" backend.
+    """
+    spec = spec or os.environ.get("ELHUB_BACKEND", DEFAULT_BACKEND)
+    if spec not in _BACKENDS:
+        if spec == "mongo":
+            if connect is None:
+                raise ValueError("The mongo backend needs a connect() function returning a MongoClient")
+            _BACKENDS[spec] = MongoBackend(connect)
+        elif spec == "parquet":
+            _BACKENDS[spec] = ParquetBackend()
+        elif spec.startswith("parquet:"):
+            _BACKENDS[spec] = ParquetBackend(spec.split(":", 1)[1])
+        else:
+            raise ValueError(f"Unknown Elhub backend: {spec}")
+        _BACKENDS[spec].spec = spec
+    return _BACKENDS[spec]
+
+
+def set_elhub_backend(spec):
+    """Switch the backend for this process (used by benchmarks)."""
+    os.environ["ELHUB_BACKEND"] = spec
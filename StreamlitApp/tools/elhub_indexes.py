@@ -0,0 +1,180 @@
+"""
+Index management and query-plan checks for the Elhub collections.
+
+`ensure_indexes` creates the compound indexes matching the app's access patterns:
+ - hourly collections: time-range scans (`starttime`) and area/group filtered ranges
+   (equality fields first, then the range field)
+ - rollup collections: granularity + group/area + period, and granularity + period (all areas/groups)
+
+`verify_query_plans` runs explain on the app's real query shapes (the find filters and the
+aggregation pipelines, built with the same helpers and arguments as their call sites) and
+reports every shape whose winning plan contains a collection scan (COLLSCAN).
+
+Usage (from the StreamlitApp folder):
+    python -m tools.elhub_indexes            # create missing indexes, then verify the plans
+    python -m tools.elhub_indexes --check    # only verify (exit code 1 when a COLLSCAN is found)
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+import pandas as pd
+import pymongo
+
+from tools.elhub_backend import build_energy_pipeline, month_range_query
+from tools.elhub_rollups import ELHUB_COLLECTIONS, ROLLUP_COLLECTIONS, build_rollup_query
+
+# Sample filter values of the query shapes
+SAMPLE_AREA = "NO1"
+SAMPLE_GROUPS = {"Production": "hydro", "Consumption": "household"}
+
+
+def index_specs():
+    """{collection: [(name, keys), ...]} of the indexes the app relies on."""
+    specs = {}
+    for mode, (collection, group_field) in ELHUB_COLLECTIONS.items():
+        specs[collection] = [
+            ("starttime_1", [("starttime", pymongo.ASCENDING)]),
+            (f"pricearea_1_{group_field}_1_starttime_1",
+             [("pricearea", pymongo.ASCENDING), (group_field, pymongo.ASCENDING), ("starttime", pymongo.ASCENDING)]),
+        ]
+        specs[ROLLUP_COLLECTIONS[mode]] = [
+            ("granularity_1_group_1_pricearea_1_period_1",
+             [("granularity", pymongo.ASCENDING), ("group", pymongo.ASCENDING),
+              ("pricearea", pymongo.ASCENDING), ("period", pymongo.ASCENDING)]),
+            ("granularity_1_pricearea_1_period_1",
+             [("granularity", pymongo.ASCENDING), ("pricearea", pymongo.ASCENDING), ("period", pymongo.ASCENDING)]),
+            ("granularity_1_period_1",
+             [("granularity", pymongo.ASCENDING), ("period", pymongo.ASCENDING)]),
+        ]
+    return specs
+
+
+def ensure_indexes(db):
+    """Create the missing indexes (existing ones are left untouched). Returns the names created."""
+    created = []
+    for collection, indexes in index_specs().items():
+        existing = {tuple(info["key"]) for info in db[collection].list_indexes()}
+        for name, keys in indexes:
+            if tuple(field for field, _ in keys) in existing:
+                continue
+            db[collection].create_index(keys, name=name)
+            created.append(f"{collection}.{name}")
+    return created
+
+
+def query_shapes(sample_start=datetime(2021, 1, 1), sample_end=datetime(2021, 12, 31)):
+    """
+    (label, collection, kind, query) of what the app sends, with sample values: kind "find" (a filter)
+    or "aggregate" (a pipeline). Each shape is built like its call site in tools.utils / the pages.
+    """
+    months = list(pd.period_range(sample_start, sample_end, freq="M"))
+    shapes = []
+    for mode, (collection, _) in ELHUB_COLLECTIONS.items():
+        rollups = ROLLUP_COLLECTIONS[mode]
+        group = SAMPLE_GROUPS[mode]
+        shapes += [
+            # get_elhub_data -> MongoBackend.load_months (energy cube, STL, correlation pages)
+            (f"{mode}: month chunks (get_elhub_data)", collection, "find", month_range_query(months)),
+            # area_means_table (map): rollups of every area and group, else the aggregation
+            (f"{mode}: rollups of all areas/groups (area_means_table)", rollups, "find",
+             build_rollup_query("M", sample_start, sample_end)),
+            (f"{mode}: area means pipeline (area_means_table)", collection, "aggregate",
+             build_energy_pipeline(mode, sample_start, sample_end, granularity="M",
+                                   by=("pricearea", "group"), then_mean=True)),
+            # rollup_totals (energy page pie chart): one area by group, else the aggregation
+            (f"{mode}: rollups of one area (rollup_totals)", rollups, "find",
+             build_rollup_query("Y", sample_start, sample_end, areas=[SAMPLE_AREA])),
+            (f"{mode}: group totals pipeline (rollup_totals)", collection, "aggregate",
+             build_energy_pipeline(mode, sample_start, sample_end, areas=[SAMPLE_AREA], by=("group",))),
+            # aggregate_energy (forecasting page): daily totals of one area and group
+            (f"{mode}: daily area/group pipeline (aggregate_energy)", collection, "aggregate",
+             build_energy_pipeline(mode, sample_start, sample_end, areas=[SAMPLE_AREA], groups=[group],
+                                   granularity="D", by=(), unique_hours=True)),
+        ]
+    return shapes
+
+
+def _winning_plans(explain):
+    """The winning plan(s) of an explain result (a find, or every cursor stage of an aggregation)."""
+    plans = []
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                plans.append(value)
+            elif key != "rejectedPlans":
+                plans += _winning_plans(value)
+    elif isinstance(explain, list):
+        for value in explain:
+            plans += _winning_plans(value)
+    return plans
+
+
+def _plan_stages(plan):
+    """All stage names in an explain() plan tree (classic and slot-based engine layouts)."""
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages += _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            stages += _plan_stages(value)
+    return stages
+
+
+def verify_query_plans(db):
+    """Explain every query shape; returns one report dict per shape with `collscan` set when it scans."""
+    reports = []
+    for label, collection, kind, query in query_shapes():
+        if kind == "aggregate":
+            explain = db.command("aggregate", collection, pipeline=query, explain=True)
+        else:
+            explain = db[collection].find(query).explain()
+        stages = _plan_stages(_winning_plans(explain))
+        reports.append({
+            "query": label,
+            "collection": collection,
+            "stages": " > ".join(dict.fromkeys(stages)),
+            "collscan": "COLLSCAN" in stages,
+        })
+    return reports
+
+
+def check_deployment(db, create=True):
+    """Startup routine: create missing indexes (when allowed) and return the COLLSCAN reports."""
+    if create:
+        try:
+            created = ensure_indexes(db)
+            if created:
+                print(f"Created Elhub indexes: {', '.join(created)}")
+        except pymongo.errors.OperationFailure as e:
+            # read-only users cannot create indexes; the plan check below still reports the problem
+            print(f"Could not create Elhub indexes: {e}")
+    scans = [report for report in verify_query_plans(db) if report["collscan"]]
+    for report in scans:
+        print(f"WARNING: collection scan for '{report['query']}' on {report['collection']}")
+    return scans
+
+
+if __name__ == "__main__":
+    from tools.elhub_ingest import mongo_uri
+
+    parser = argparse.ArgumentParser(description="Create and verify the indexes of the Elhub collections")
+    parser.add_argument("--check", action="store_true", help="only verify the query plans")
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(mongo_uri(args.mongo_uri))["elhub_db"]
+    if not args.check:
+        created = ensure_indexes(db)
+        print(f"Created {len(created)} index(es): {', '.join(created) or '-'}")
+
+    reports = verify_query_plans(db)
+    width = max(len(r["query"]) for r in reports)
+    for report in reports:
+        status = "COLLSCAN" if report["collscan"] else "ok"
+        print(f"{report['query']:<{width}}  {status:<8}  {report['stages']}")
+    sys.exit(1 if any(r["collscan"] for r in reports) else 0)
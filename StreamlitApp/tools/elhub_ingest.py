@@ -0,0 +1,162 @@
+"""
+Elhub ingestion job: Elhub energy-data API -> MongoDB hourly collections -> rollup collections.
+
+It follows the flow of the CA2/CA4 notebooks (one API request per month, October split in two
+because of the DST change) and writes straight to MongoDB. Each month is replaced as a whole (its hourly documents are deleted
+and inserted again), so a month can be re-ingested safely, also when it was first loaded by the
+notebooks. Afterwards the daily, monthly and yearly rollups of the ingested months are rebuilt
+(see tools/elhub_rollups.py).
+
+Usage (from the StreamlitApp folder):
+    python -m tools.elhub_ingest --years 2021 2024
+    python -m tools.elhub_ingest --years 2024 2024 --months 10 11 --datasets Production
+    python -m tools.elhub_ingest --years 2021 2024 --rollups-only   # rollups from the stored hourly data
+
+The MongoDB URI is taken from --mongo-uri, the MONGO_URI environment variable or
+.streamlit/secrets.toml ([mongo] uri).
+"""
+
+import argparse
+import os
+import tomllib
+from datetime import datetime, timedelta
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import pymongo
+import requests
+
+from tools.elhub_rollups import ELHUB_COLLECTIONS, refresh_rollups
+
+ELHUB_URL = "https://api.elhub.no/energy-data/v0/price-areas"
+# API dataset name and response attribute of each data mode
+ELHUB_DATASETS = {
+    "Production": ("PRODUCTION_PER_GROUP_MBA_HOUR", "productionPerGroupMbaHour"),
+    "Consumption": ("CONSUMPTION_PER_GROUP_MBA_HOUR", "consumptionPerGroupMbaHour"),
+}
+NORWAY_TZ = ZoneInfo("Europe/Oslo")
+SECRETS_PATH = Path(__file__).resolve().parent.parent / ".streamlit" / "secrets.toml"
+WRITE_BATCH = 5_000
+
+
+def get_period_start_end(year, m):
+    """A whole month in Norwegian local time (first hour to last hour)."""
+    start_date = datetime(year, m, 1, tzinfo=NORWAY_TZ)
+    if m == 12:
+        end_date = datetime(year + 1, 1, 1, tzinfo=NORWAY_TZ) - timedelta(hours=1)
+    else:
+        end_date = datetime(year, m + 1, 1, tzinfo=NORWAY_TZ) - timedelta(hours=1)
+    return start_date, end_date
+
+
+def month_parts(year, m):
+    """
+    Request windows of one month. The API limits retrieval to one month at a time and October fails
+    because the DST change adds an extra hour, so October is split in two parts.
+    """
+    start_dt, end_dt = get_period_start_end(year, m)
+    if m != 10:
+        return [(start_dt, end_dt)]
+    return [
+        (start_dt, datetime(year, 10, 20, 23, tzinfo=NORWAY_TZ)),
+        (datetime(year, 10, 21, 0, tzinfo=NORWAY_TZ), datetime(year, 10, 31, 23, tzinfo=NORWAY_TZ)),
+    ]
+
+
+def load_parse_data_fra_api(start_dt, end_dt, required_dataset, attr_val, session=requests):
+    """Records of a dataset for a time window, as returned by the Elhub API."""
+    params = {
+        "dataset": required_dataset,
+        "startDate": start_dt.isoformat(),
+        "endDate": end_dt.isoformat(),
+    }
+    response = session.get(ELHUB_URL, params=params, timeout=120)
+    if response.status_code != 200:
+        print(f"Failed to get data for {start_dt} - {end_dt}: status {response.status_code}")
+        return []
+
+    parsed_data = []
+    for data in response.json()["data"]:
+        parsed_data.extend(data["attributes"][attr_val])
+    return parsed_data
+
+
+def to_documents(records):
+    """
+    API records -> MongoDB documents: lower-case field names and timestamps as naive Norwegian
+    local time, like the data written by the notebooks (Spark -> toPandas -> insert_many).
+    """
+    if not records:
+        return []
+    df = pd.DataFrame(records)
+    df.columns = [c.lower() for c in df.columns]
+    for column in ("starttime", "endtime", "lastupdatedtime"):
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], utc=True).dt.tz_convert(NORWAY_TZ).dt.tz_localize(None)
+    return df.to_dict(orient="records")
+
+
+def replace_month(collection, year, m, documents):
+    """
+    Replace the stored hours of one month by `documents`.
+    (Local time repeats an hour in October, so documents cannot be upserted on starttime.)
+    """
+    month_start = datetime(year, m, 1)
+    month_end = datetime(year + 1, 1, 1) if m == 12 else datetime(year, m + 1, 1)
+    collection.delete_many({"starttime": {"$gte": month_start, "$lt": month_end}})
+    for i in range(0, len(documents), WRITE_BATCH):
+        collection.insert_many(documents[i:i + WRITE_BATCH], ordered=False)
+
+
+def ingest_month(db, mode, year, m, session=requests):
+    """Fetch one month of a dataset from the API and replace it in MongoDB. Returns the number of records."""
+    collection, _ = ELHUB_COLLECTIONS[mode]
+    required_dataset, attr_val = ELHUB_DATASETS[mode]
+    records = []
+    for start_part, end_part in month_parts(year, m):
+        records.extend(load_parse_data_fra_api(start_part, end_part, required_dataset, attr_val, session))
+    if not records:
+        # keep what is stored when the API returned nothing (e.g. a failed request)
+        return 0
+    documents = to_documents(records)
+    replace_month(db[collection], year, m, documents)
+    return len(documents)
+
+
+def mongo_uri(cli_value=None):
+    if cli_value:
+        return cli_value
+    if os.environ.get("MONGO_URI"):
+        return os.environ["MONGO_URI"]
+    with open(SECRETS_PATH, "rb") as f:
+        return tomllib.load(f)["mongo"]["uri"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest Elhub data into MongoDB and build the rollup collections")
+    parser.add_argument("--years", nargs=2, type=int, required=True, metavar=("START", "END"))
+    parser.add_argument("--months", nargs="+", type=int, default=list(range(1, 13)), metavar="M")
+    parser.add_argument("--datasets", nargs="+", choices=list(ELHUB_COLLECTIONS), default=list(ELHUB_COLLECTIONS))
+    parser.add_argument("--rollups-only", action="store_true", help="skip the API, only rebuild the rollups")
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    client = pymongo.MongoClient(mongo_uri(args.mongo_uri))
+    db = client["elhub_db"]
+    start_year, end_year = args.years
+    months = [pd.Period(year=y, month=m, freq="M") for y in range(start_year, end_year + 1) for m in args.months]
+
+    with requests.Session() as session:
+        for mode in args.datasets:
+            received = None
+            if not args.rollups_only:
+                received = set()
+                for month in months:
+                    n_records = ingest_month(db, mode, month.year, month.month, session)
+                    print(f"{mode} {month}: {n_records} records")
+                    if n_records:
+                        received.add(month)
+            # months the API returned nothing for keep being aggregated from the hourly rows
+            refresh_rollups(db, mode, months, received)
+            print(f"{mode}: rollups rebuilt for {months[0]} → {months[-1]}")
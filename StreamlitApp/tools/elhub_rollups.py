@@ -0,0 +1,159 @@
+"""
+Pre-aggregated Elhub rollups, built in MongoDB from the hourly collections.
+
+For each dataset, one rollup collection holds one document per (pricearea, group, granularity, period):
+
+    {"_id": {"pricearea": "NO1", "group": "hydro", "granularity": "M", "period": 2021-01-01},
+     "pricearea": "NO1", "group": "hydro", "granularity": "M", "period": 2021-01-01,
+     "quantitykwh": 1.2e9, "hours": 744}
+
+with granularity "D" (day), "M" (month) or "Y" (year). `starttime` is stored as naive Norwegian
+local time, so periods are local calendar days, months and years.
+`rollup_months` records which months have been rolled up, so readers know when the rollups
+cover a range. This module has no Streamlit dependency: it is used by the ingestion job too.
+"""
+
+import datetime
+
+import pandas as pd
+
+# Collection and group field of each data mode
+ELHUB_COLLECTIONS = {
+    "Production": ("production_data", "productiongroup"),
+    "Consumption": ("consumption_data", "consumptiongroup"),
+}
+ROLLUP_COLLECTIONS = {
+    "Production": "production_rollups",
+    "Consumption": "consumption_rollups",
+}
+ROLLUP_STATE = "rollup_months"
+ROLLUP_GRANULARITIES = ("D", "M", "Y")
+
+# Date parts kept when truncating `starttime` (naive local time) to a period
+PERIOD_PARTS = {
+    "H": ("year", "month", "day", "hour"),
+    "D": ("year", "month", "day"),
+    "M": ("year", "month"),
+    "Y": ("year",),
+}
+_PART_OPERATORS = {"year": "$year", "month": "$month", "day": "$dayOfMonth", "hour": "$hour"}
+
+
+def period_expression(granularity):
+    """`starttime` truncated to the start of its hour/day/month/year."""
+    parts = PERIOD_PARTS[granularity]
+    return {"$dateFromParts": {part: {_PART_OPERATORS[part]: "$starttime"} for part in parts}}
+
+
+def _period_window(months, granularity):
+    """[start, end) covering whole periods of `granularity` around a run of months."""
+    first, last = min(months), max(months)
+    if granularity == "Y":
+        return pd.Timestamp(first.year, 1, 1), pd.Timestamp(last.year + 1, 1, 1)
+    return first.start_time, (last + 1).start_time
+
+
+def rollup_pipeline(mode, granularity, start_dt, end_dt):
+    """$match/$group/$merge pipeline (re)building the rollups of the periods in [start_dt, end_dt)."""
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    key = {"pricearea": "$pricearea", "group": f"${group_field}", "period": period_expression(granularity)}
+    return [
+        {"$match": {"starttime": {"$gte": start_dt.to_pydatetime(), "$lt": end_dt.to_pydatetime()}}},
+        {"$group": {"_id": key, "quantitykwh": {"$sum": "$quantitykwh"}, "hours": {"$sum": 1}}},
+        {"$project": {
+            "_id": {
+                "pricearea": "$_id.pricearea", "group": "$_id.group",
+                "granularity": {"$literal": granularity}, "period": "$_id.period",
+            },
+            "pricearea": "$_id.pricearea",
+            "group": "$_id.group",
+            "granularity": {"$literal": granularity},
+            "period": "$_id.period",
+            "quantitykwh": 1,
+            "hours": 1,
+        }},
+        {"$merge": {"into": ROLLUP_COLLECTIONS[mode], "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}},
+    ]
+
+
+def closed_months(months, now=None):
+    """The months that can no longer receive data (ended more than a day ago, Norwegian local time)."""
+    now = now or pd.Timestamp.now(tz="Europe/Oslo").tz_localize(None)
+    return [month for month in months if month.end_time < now - pd.Timedelta(days=1)]
+
+
+def refresh_rollups(db, mode, months, received=None):
+    """
+    Rebuild the daily, monthly and yearly rollups touched by `months` (pandas monthly periods).
+    Yearly rollups are rebuilt over their whole years.
+    Only months that are closed, have rollups (data) and, when `received` is given, are in it
+    (e.g. the months the ingestion got documents for) are marked as rolled up; the marks of
+    the other months are removed, so readers aggregate the hourly rows for them instead.
+    Every month of the rebuilt years is unmarked while its rollups are deleted and rebuilt, so
+    readers never take a half-built rollup for a covered one; untouched months get their mark back.
+    """
+    months = sorted(set(months))
+    if not months:
+        return
+    year_start, year_end = _period_window(months, "Y")
+    rebuilt = [str(month) for month in pd.period_range(year_start, year_end - pd.Timedelta(days=1), freq="M")]
+    kept = covered_months(db, mode, rebuilt) - {str(month) for month in months}
+    db[ROLLUP_STATE].delete_many({"_id": {"$in": [f"{mode}:{month}" for month in rebuilt]}})
+
+    raw = db[ELHUB_COLLECTIONS[mode][0]]
+    for granularity in ROLLUP_GRANULARITIES:
+        start_dt, end_dt = _period_window(months, granularity)
+        # Stale periods are removed first, so periods without data do not keep old totals
+        db[ROLLUP_COLLECTIONS[mode]].delete_many({
+            "granularity": granularity,
+            "period": {"$gte": start_dt.to_pydatetime(), "$lt": end_dt.to_pydatetime()},
+        })
+        raw.aggregate(rollup_pipeline(mode, granularity, start_dt, end_dt), allowDiskUse=True)
+
+    start_dt, end_dt = _period_window(months, "M")
+    with_data = {
+        pd.Timestamp(period).to_period("M")
+        for period in db[ROLLUP_COLLECTIONS[mode]].distinct("period", {
+            "granularity": "M", "period": {"$gte": start_dt.to_pydatetime(), "$lt": end_dt.to_pydatetime()},
+        })
+    }
+    marked = [
+        str(month) for month in closed_months(months)
+        if month in with_data and (received is None or month in received)
+    ]
+
+    built_at = datetime.datetime.now(datetime.timezone.utc)
+    for month in sorted(kept) + marked:
+        db[ROLLUP_STATE].replace_one(
+            {"_id": f"{mode}:{month}"},
+            {"_id": f"{mode}:{month}", "dataset": mode, "month": month, "built_at": built_at},
+            upsert=True,
+        )
+
+
+def covered_months(db, mode, months):
+    """The subset of `months` (strings "YYYY-MM") whose rollups have been built."""
+    ids = [f"{mode}:{month}" for month in months]
+    return {doc["month"] for doc in db[ROLLUP_STATE].find({"_id": {"$in": ids}}, {"month": 1})}
+
+
+def build_rollup_query(granularity, start_dt, end_dt, areas=None, groups=None):
+    """Filter selecting the rollups of the periods starting in [start_dt, end_dt]."""
+    query = {"granularity": granularity}
+    if groups is not None:
+        query["group"] = {"$in": list(groups)}
+    if areas is not None:
+        query["pricearea"] = {"$in": list(areas)}
+    query["period"] = {"$gte": pd.Timestamp(start_dt).to_pydatetime(), "$lte": pd.Timestamp(end_dt).to_pydatetime()}
+    return query
+
+
+def read_rollups(db, mode, granularity, start_dt, end_dt, areas=None, groups=None):
+    """Rollup rows (pricearea, group, period, quantitykwh) of the periods starting in [start_dt, end_dt]."""
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    query = build_rollup_query(granularity, start_dt, end_dt, areas, groups)
+    projection = {"_id": 0, "pricearea": 1, "group": 1, "period": 1, "quantitykwh": 1}
+    df = pd.DataFrame(list(db[ROLLUP_COLLECTIONS[mode]].find(query, projection)))
+    df = df.reindex(columns=["pricearea", "group", "period", "quantitykwh"]).rename(columns={"group": group_field})
+    df["period"] = pd.to_datetime(df["period"])
+    return df
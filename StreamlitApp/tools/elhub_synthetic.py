@@ -0,0 +1,137 @@
+"""
+Synthetic Elhub data: hourly rows for the 5 price areas x all production/consumption groups,
+shaped like the real collections (naive Norwegian local time, one row per area/group/hour,
+the October DST hour twice) with seasonal, weekly and daily cycles and seeded noise.
+
+Used to run and profile the energy pages offline, at production scale, on either backend.
+
+Usage (from the StreamlitApp folder):
+    python -m tools.elhub_synthetic --years 2021 2024                       # -> data/elhub_store (Parquet)
+    python -m tools.elhub_synthetic --years 2021 2024 --to parquet:/tmp/elhub
+    python -m tools.elhub_synthetic --years 2021 2024 --to mongo --mongo-uri mongodb://localhost:27017
+"""
+
+import argparse
+import zlib
+
+import numpy as np
+import pandas as pd
+
+from tools.elhub_rollups import ELHUB_COLLECTIONS
+
+PRICE_AREAS = ["NO1", "NO2", "NO3", "NO4", "NO5"]
+ENERGY_GROUPS = {
+    "Production": ["hydro", "wind", "solar", "thermal", "other"],
+    "Consumption": ["household", "cabin", "primary", "secondary", "tertiary"],
+}
+# Mean hourly kWh of each group, and the relative size of each price area
+_GROUP_LEVEL = {
+    "hydro": 1.6e6, "wind": 2.5e5, "solar": 8e3, "thermal": 2e4, "other": 1e3,
+    "household": 6e5, "cabin": 3e4, "primary": 1.5e5, "secondary": 4e5, "tertiary": 3.5e5,
+}
+_AREA_SCALE = {"NO1": 0.8, "NO2": 1.4, "NO3": 0.7, "NO4": 0.6, "NO5": 0.9}
+
+
+def local_month_hours(month):
+    """Naive local (Europe/Oslo) wall-clock hours of a month, as stored by the ingestion (October repeats one hour)."""
+    start = month.start_time.tz_localize("Europe/Oslo")
+    end = (month + 1).start_time.tz_localize("Europe/Oslo")
+    return pd.date_range(start, end, freq="h", inclusive="left").tz_localize(None)
+
+
+def _profile(group, hours):
+    """Relative hourly profile of a group (mean about 1)."""
+    day_of_year = hours.dayofyear.to_numpy()
+    hour = hours.hour.to_numpy()
+    weekend = hours.dayofweek.to_numpy() >= 5
+    winter = np.cos(2 * np.pi * (day_of_year - 15) / 365.25)  # 1 in mid-January, -1 in mid-July
+    daily = np.sin(2 * np.pi * (hour - 6) / 24)                # peak around noon
+
+    if group == "solar":
+        return np.clip(daily, 0, None) * (1 - 0.9 * winter) * 3
+    if group == "wind":
+        return 1 + 0.4 * winter
+    if group == "hydro":
+        return 1 + 0.3 * winter + 0.1 * daily
+    if group == "cabin":
+        return 1 + 0.6 * winter + 0.5 * weekend
+    if group in ("household", "tertiary"):
+        return 1 + 0.35 * winter + 0.15 * daily - 0.1 * weekend * (group == "tertiary")
+    if group == "secondary":
+        return 1 + 0.05 * winter - 0.1 * weekend
+    return 1 + 0.1 * winter
+
+
+def synthetic_month(mode, month):
+    """Hourly rows of one dataset and month (columns as loaded by get_elhub_data), deterministic per (mode, month)."""
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    hours = local_month_hours(month)
+    rng = np.random.default_rng(zlib.crc32(f"{mode}:{month}".encode()))
+    groups = ENERGY_GROUPS[mode]
+
+    frames = []
+    for area in PRICE_AREAS:
+        for group in groups:
+            noise = rng.standard_normal(len(hours))
+            if group == "wind":
+                # wind is persistent over hours: smooth the noise
+                noise = np.convolve(noise, np.ones(12) / np.sqrt(12), mode="same")
+            level = _GROUP_LEVEL[group] * _AREA_SCALE[area]
+            values = np.clip(level * (_profile(group, hours) + 0.1 * noise), 0, None)
+            frames.append(pd.DataFrame({
+                "starttime": hours,
+                "pricearea": area,
+                group_field: group,
+                "quantitykwh": values.round(3),
+            }))
+    df = pd.concat(frames, ignore_index=True)
+    df["pricearea"] = pd.Categorical(df["pricearea"], categories=PRICE_AREAS)
+    df[group_field] = pd.Categorical(df[group_field], categories=groups)
+    return df
+
+
+def write_parquet(root, modes, months):
+    from tools.elhub_backend import ParquetBackend
+
+    backend = ParquetBackend(root) if root else ParquetBackend()
+    for mode in modes:
+        for month in months:
+            backend.write_month(mode, str(month), synthetic_month(mode, month))
+        print(f"{mode}: {len(months)} month(s) written to {backend.root}")
+
+
+def write_mongo(db, modes, months):
+    from tools.elhub_ingest import replace_month
+    from tools.elhub_indexes import ensure_indexes
+    from tools.elhub_rollups import refresh_rollups
+
+    ensure_indexes(db)
+    for mode in modes:
+        collection, _ = ELHUB_COLLECTIONS[mode]
+        for month in months:
+            df = synthetic_month(mode, month)
+            df = df.astype({"pricearea": object, ELHUB_COLLECTIONS[mode][1]: object})
+            replace_month(db[collection], month.year, month.month, df.to_dict(orient="records"))
+        refresh_rollups(db, mode, months)
+        print(f"{mode}: {len(months)} month(s) written to {collection}, rollups rebuilt")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic hourly Elhub data")
+    parser.add_argument("--years", nargs=2, type=int, required=True, metavar=("START", "END"))
+    parser.add_argument("--datasets", nargs="+", choices=list(ELHUB_COLLECTIONS), default=list(ELHUB_COLLECTIONS))
+    parser.add_argument("--to", default="parquet", help='"parquet", "parquet:<folder>" or "mongo"')
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    start_year, end_year = args.years
+    months = list(pd.period_range(f"{start_year}-01", f"{end_year}-12", freq="M"))
+    if args.to == "mongo":
+        import pymongo
+        from tools.elhub_ingest import mongo_uri
+
+        write_mongo(pymongo.MongoClient(mongo_uri(args.mongo_uri))["elhub_db"], args.datasets, months)
+    elif args.to == "parquet" or args.to.startswith("parquet:"):
+        write_parquet(args.to.partition(":")[2], args.datasets, months)
+    else:
+        parser.error(f"Unknown target: {args.to}")
@@ -0,0 +1,169 @@
+"""
+Dense in-memory representation of one Elhub dataset.
+
+An EnergyCube holds
+ - `hours`: a contiguous hourly axis (int64 hours since 1970-01-01 UTC), shared by all series
+ - `values`: one read-only float64 array indexed [area, group, hour], NaN where an hour has no row
+ - offset tables of the price areas and groups, and row offsets of every local month and year
+
+so pages take the series of an area/group/month as an array view instead of masking the long frame.
+
+`starttime` in the collections is naive Norwegian local time: the repeated October hour appears
+twice and is mapped to its two UTC hours; further duplicates of an hour are dropped (first kept).
+"""
+
+import numpy as np
+import pandas as pd
+
+from tools.weather_frame import period_offsets
+
+LOCAL_TZ = "Europe/Oslo"
+_NS_PER_HOUR = 3_600_000_000_000
+
+
+class EnergyCube:
+
+    def __init__(self, hours, values, areas, groups, group_field, tz=LOCAL_TZ):
+        self.hours = np.ascontiguousarray(hours, dtype=np.int64)
+        self.values = np.ascontiguousarray(values, dtype=np.float64)
+        self.hours.flags.writeable = False
+        self.values.flags.writeable = False
+        self.areas = list(areas)
+        self.groups = list(groups)
+        self.area_index = {area: i for i, area in enumerate(self.areas)}
+        self.group_index = {group: i for i, group in enumerate(self.groups)}
+        self.group_field = group_field
+        self.tz = tz
+        # Naive local timestamps of the axis, like `starttime` in the loader frames
+        self.starttime = self.dates.tz_localize(None)
+        self.month_offsets, self.year_offsets = period_offsets(self.dates)
+
+    @classmethod
+    def from_frame(cls, df, group_field, tz=LOCAL_TZ):
+        """Build from a loader frame (starttime, pricearea, group column, quantitykwh), e.g. from get_elhub_data."""
+        if df.empty:
+            return cls(np.array([], dtype=np.int64), np.empty((0, 0, 0)), [], [], group_field, tz)
+
+        area = df["pricearea"].astype("category").cat
+        group = df[group_field].astype("category").cat
+        area_codes = area.codes.to_numpy()
+        group_codes = group.codes.to_numpy()
+        wall = df["starttime"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+        keep = (area_codes >= 0) & (group_codes >= 0)
+
+        # Rank of each row among the rows of the same area, group and wall-clock hour (stable: first loaded first)
+        order = np.lexsort((wall, group_codes, area_codes))
+        order = order[keep[order]]
+        a, g, t = area_codes[order], group_codes[order], wall[order]
+        new_run = np.ones(len(order), dtype=bool)
+        new_run[1:] = (a[1:] != a[:-1]) | (g[1:] != g[:-1]) | (t[1:] != t[:-1])
+        positions = np.arange(len(order))
+        rank = positions - np.maximum.accumulate(np.where(new_run, positions, 0))
+
+        # Local wall time -> UTC: the first occurrence of the repeated hour is summer time
+        utc = (
+            pd.DatetimeIndex(t)
+            .tz_localize(tz, ambiguous=rank == 0, nonexistent="NaT")
+            .tz_convert("UTC")
+        )
+        valid = ~utc.isna()
+        hour = np.where(valid, utc.asi8 // _NS_PER_HOUR, np.iinfo(np.int64).min)
+        # Later duplicates land on an hour already taken: keep the first row of each area/group/hour
+        duplicate = np.zeros(len(order), dtype=bool)
+        duplicate[1:] = (a[1:] == a[:-1]) & (g[1:] == g[:-1]) & (hour[1:] == hour[:-1])
+        take = valid & ~duplicate
+
+        hours = np.arange(hour[take].min(), hour[take].max() + 1, dtype=np.int64) if take.any() else np.array([], dtype=np.int64)
+        values = np.full((len(area.categories), len(group.categories), len(hours)), np.nan)
+        if take.any():
+            quantity = df["quantitykwh"].to_numpy(dtype=np.float64)[order]
+            values[a[take], g[take], hour[take] - hours[0]] = quantity[take]
+        return cls(hours, values, area.categories, group.categories, group_field, tz)
+
+    # ---------------------------------------------------------------- basic info
+    def __len__(self):
+        return len(self.hours)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.hours.nbytes + self.values.nbytes
+
+    @property
+    def months(self):
+        """Local month labels ("YYYY-MM") in time order."""
+        return list(self.month_offsets)
+
+    @property
+    def dates(self):
+        """Local timestamps of the axis (built on demand from the hour index)."""
+        return pd.DatetimeIndex(self.hours * _NS_PER_HOUR, tz="UTC").tz_convert(self.tz)
+
+    def groups_with_data(self, area=None, rows=slice(None)):
+        """Groups with at least one value (in an area, when given)."""
+        values = self.values[:, :, rows] if area is None else self.values[[self.area_index[area]], :, rows]
+        present = ~np.isnan(values).all(axis=(0, 2))
+        return [group for group, has in zip(self.groups, present) if has]
+
+    def has_data(self, area=None, group=None, rows=slice(None)):
+        values = self.values
+        if area is not None:
+            if area not in self.area_index:
+                return False
+            values = values[self.area_index[area]][None]
+        if group is not None:
+            if group not in self.group_index:
+                return False
+            values = values[:, self.group_index[group]][:, None]
+        return bool(values.size) and not np.isnan(values[..., rows]).all()
+
+    # ---------------------------------------------------------------- slicing
+    def month_slice(self, start_month, end_month=None):
+        """Axis slice covering the local months start_month..end_month ("YYYY-MM" labels, inclusive), empty when absent."""
+        end_month = end_month or start_month
+        if start_month not in self.month_offsets or end_month not in self.month_offsets:
+            return slice(0, 0)
+        return slice(self.month_offsets[start_month][0], self.month_offsets[end_month][1])
+
+    def year_slice(self, year):
+        start, stop = self.year_offsets.get(int(year), (0, 0))
+        return slice(start, stop)
+
+    def time_slice(self, start, end):
+        """Axis slice of the local wall-clock times start <= starttime <= end (binary search)."""
+        stamps = self.starttime.asi8
+        return slice(int(np.searchsorted(stamps, pd.Timestamp(start).value, "left")),
+                     int(np.searchsorted(stamps, pd.Timestamp(end).value, "right")))
+
+    def view(self, area, group, rows=slice(None)):
+        """Read-only float64 view of one area/group series (NaN for hours without data)."""
+        return self.values[self.area_index[area], self.group_index[group], rows]
+
+    def series(self, area, group, rows=slice(None), dropna=True):
+        """One area/group series indexed by `starttime` (naive local time); without gaps unless dropna=False."""
+        if area not in self.area_index or group not in self.group_index:
+            return pd.Series([], index=pd.DatetimeIndex([], name="starttime"), name="quantitykwh", dtype=np.float64)
+        values = self.view(area, group, rows)
+        series = pd.Series(values, index=self.starttime[rows], name="quantitykwh", copy=False)
+        series.index.name = "starttime"
+        return series.dropna() if dropna else series
+
+    # ---------------------------------------------------------------- pandas output
+    def to_frame(self, areas=None, groups=None, rows=slice(None), dropna=True):
+        """Long frame (starttime, pricearea, group column, quantitykwh) of a sub-cube, like the loader frames."""
+        areas = self.areas if areas is None else [a for a in areas if a in self.area_index]
+        groups = self.groups if groups is None else [g for g in groups if g in self.group_index]
+        sub = self.values[np.ix_([self.area_index[a] for a in areas], [self.group_index[g] for g in groups])][..., rows]
+        n_areas, n_groups, n_hours = sub.shape
+        df = pd.DataFrame({
+            "starttime": np.tile(self.starttime[rows].to_numpy(), n_areas * n_groups),
+            "pricearea": pd.Categorical.from_codes(np.repeat(np.arange(n_areas), n_groups * n_hours), categories=areas),
+            self.group_field: pd.Categorical.from_codes(
+                np.tile(np.repeat(np.arange(n_groups), n_hours), n_areas), categories=groups
+            ),
+            "quantitykwh": sub.reshape(-1),
+        })
+        return df.dropna(subset=["quantitykwh"]).reset_index(drop=True) if dropna else df
@@ -0,0 +1,151 @@
+"""
+Local Outlier Factor of a single variable, without a tree search.
+
+In one dimension the k nearest neighbours of a value are a contiguous window of the sorted values
+around it, so the neighbour graph is one sort plus k vectorized steps that extend every window
+by its nearer end (O(n log n + n*k)). The graph is built once for the largest k and stored with
+the neighbours in distance order, so any smaller k is its first k columns:
+
+ 1. graph stage     `neighbour_graph(values, max_k)` : indices/distances of the max_k nearest neighbours
+ 2. score stage     `lof_scores(graph, k)`           : local outlier factor of every point (as sklearn)
+ 3. threshold stage `lof_outliers(positions, scores, contamination, n_rows)` : outlier mask of the input rows
+
+For several variables (`joint_neighbour_graph`) the graph comes from a KD-tree over the
+standardised rows, queried in parallel. For long records the tree can hold a random subsample
+of the rows (the reference set): every row is then scored against the density of its nearest
+reference rows, as LocalOutlierFactor(novelty=True).score_samples scores new points; the
+score and threshold stages are the same.
+
+Scores follow sklearn.neighbors.LocalOutlierFactor (same reachability distances, the same 1e-10
+guard on duplicated values, the same percentile offset); with tied distances the chosen
+neighbours, and so the scores, may differ.
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class NeighbourGraph:
+
+    def __init__(self, indices, distances, positions, reference=None):
+        self.indices = indices        # [n, max_k] neighbour rows (into the valid values), nearest first
+        self.distances = distances    # [n, max_k] matching distances
+        self.positions = positions    # row of each valid value in the input (NaN values are left out)
+        self.reference = reference    # graph of the reference rows when neighbours come from a subsample (indices then point into it)
+
+    @property
+    def max_k(self):
+        return self.indices.shape[1]
+
+    @property
+    def nbytes(self):
+        nbytes = self.indices.nbytes + self.distances.nbytes + self.positions.nbytes
+        return nbytes + (self.reference.nbytes if self.reference is not None else 0)
+
+
+def neighbour_graph(values, max_k):
+    """k-nearest-neighbour graph of the non-NaN values for k = max_k (capped at n - 1)."""
+    values = np.asarray(values, dtype=np.float64)
+    positions = np.flatnonzero(~np.isnan(values))
+    x = values[positions]
+    n = len(x)
+    max_k = max(min(int(max_k), n - 1), 0)
+
+    order = np.argsort(x, kind="stable")
+    xs = x[order]
+    left = np.arange(n) - 1
+    right = np.arange(n) + 1
+    indices = np.empty((n, max_k), dtype=np.intp)
+    distances = np.empty((n, max_k), dtype=np.float64)
+    for j in range(max_k):
+        # Every window grows by its nearer end (the left one on ties)
+        d_left = np.where(left >= 0, xs - xs[np.maximum(left, 0)], np.inf)
+        d_right = np.where(right < n, xs[np.minimum(right, n - 1)] - xs, np.inf)
+        take_left = d_left <= d_right
+        indices[:, j] = np.where(take_left, left, right)
+        distances[:, j] = np.where(take_left, d_left, d_right)
+        left -= take_left
+        right += ~take_left
+
+    # Sorted ranks -> rows of the valid values
+    graph_indices = np.empty_like(indices)
+    graph_indices[order] = order[indices]
+    graph_distances = np.empty_like(distances)
+    graph_distances[order] = distances
+    for array in (graph_indices, graph_distances, positions):
+        array.flags.writeable = False
+    return NeighbourGraph(graph_indices, graph_distances, positions)
+
+
+def standardize(matrix):
+    """Columns scaled to zero mean and unit SD (NaN ignored; constant columns are only centred)."""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    sd = np.nanstd(matrix, axis=0)
+    return (matrix - np.nanmean(matrix, axis=0)) / np.where(sd > 0, sd, 1.0)
+
+
+def joint_neighbour_graph(matrix, max_k, workers=-1, reference_size=None, seed=0):
+    """
+    k-nearest-neighbour graph of the complete rows of a [n, variables] array (rows with a NaN are
+    left out), from one KD-tree queried by `workers` threads (-1: all cores). With reference_size
+    < n the tree holds only that many randomly drawn rows (fixed `seed`) and every row's
+    neighbours are reference rows; the graph of the reference rows among themselves is kept in
+    `reference` for their densities.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    positions = np.flatnonzero(~np.isnan(matrix).any(axis=1))
+    x = matrix[positions]
+    n = len(x)
+    subsample = reference_size is not None and reference_size < n
+    sample = np.sort(np.random.default_rng(seed).choice(n, reference_size, replace=False)) if subsample else np.arange(n)
+    max_k = max(min(int(max_k), len(sample) - 1), 0)
+    if max_k == 0:
+        return NeighbourGraph(np.empty((n, 0), dtype=np.intp), np.empty((n, 0)), positions)
+
+    tree = cKDTree(x[sample], balanced_tree=False)
+    distances, indices = tree.query(x, k=max_k + 1, workers=workers)
+    # Drop each reference row itself (with duplicated rows it may be missing); other rows drop their farthest
+    reference_row = np.full(n, -1)
+    reference_row[sample] = np.arange(len(sample))
+    is_self = indices == reference_row[:, None]
+    is_self[~is_self.any(axis=1), -1] = True
+    keep = ~is_self
+    indices = indices[keep].reshape(n, max_k).astype(np.intp)
+    distances = distances[keep].reshape(n, max_k)
+    reference = NeighbourGraph(indices[sample], distances[sample], positions[sample]) if subsample else None
+    for array in (indices, distances, positions):
+        array.flags.writeable = False
+    return NeighbourGraph(indices, distances, positions, reference)
+
+
+def lof_scores(graph, k):
+    """Local outlier factor (>= ~1, larger is more outlying) of every valid value for k neighbours."""
+    k = min(int(k), graph.max_k)
+    if k < 1:
+        return np.ones(len(graph.positions))
+    indices = graph.indices[:, :k]
+    distances = graph.distances[:, :k]
+    if graph.reference is None:
+        lrd = _local_reachability_density(indices, distances, distances[:, -1])
+        return lrd[indices].mean(axis=1) / lrd
+    # Neighbours are reference rows: their k-distances and densities come from the reference graph
+    reference = graph.reference
+    reference_k_distance = reference.distances[:, k - 1]
+    reference_lrd = _local_reachability_density(reference.indices[:, :k], reference.distances[:, :k], reference_k_distance)
+    lrd = _local_reachability_density(indices, distances, reference_k_distance)
+    return reference_lrd[indices].mean(axis=1) / lrd
+
+
+def _local_reachability_density(indices, distances, k_distance):
+    reach = np.maximum(distances, k_distance[indices])
+    return 1.0 / (reach.mean(axis=1) + 1e-10)
+
+
+def lof_outliers(positions, scores, contamination, n_rows):
+    """Outlier mask over the n_rows input rows: the `contamination` share of largest scores (NaN rows are never outliers)."""
+    mask = np.zeros(n_rows, dtype=bool)
+    if len(scores):
+        negative_factor = -scores
+        offset = np.percentile(negative_factor, 100.0 * contamination)
+        mask[positions] = negative_factor < offset
+    return mask
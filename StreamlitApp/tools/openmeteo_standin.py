@@ -0,0 +1,146 @@
+"""
+Local stand-in for the Open-Meteo archive API (JSON format only).
+
+It answers GET /v1/archive with the same query parameters and response layout as
+archive-api.open-meteo.com, backed by an offline provider ("csv" or "synthetic"),
+so every weather code path can be load-tested without network access.
+
+Usage (from the StreamlitApp folder):
+    python -m tools.openmeteo_standin --source csv --port 8765
+    WEATHER_PROVIDER=http://127.0.0.1:8765 streamlit run Home.py
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from tools.weather_provider import get_weather_provider, WEATHER_VARIABLES, LOCAL_TZ
+
+UNITS = {
+    "temperature_2m": "°C",
+    "wind_speed_10m": "m/s",
+    "wind_gusts_10m": "m/s",
+    "wind_direction_10m": "°",
+    "precipitation": "mm",
+}
+
+
+def _split(query, key, default=None):
+    """Query values may be repeated (?a=1&a=2) or comma separated (?a=1,2)."""
+    values = [v for item in query.get(key, []) for v in item.split(",") if v]
+    return values or default
+
+
+def _to_json_list(values):
+    values = np.asarray(values, dtype=float).round(2).astype(object)
+    values[np.isnan(values.astype(float))] = None
+    return values.tolist()
+
+
+def build_response(provider, latitude, longitude, start_date, end_date, variables, timeformat):
+    start = time.perf_counter()
+    df = provider.fetch(latitude, longitude, start_date, end_date, variables)
+    local = df["date"].dt.tz_convert(LOCAL_TZ)
+
+    if timeformat == "unixtime":
+        times = (df["date"].astype("int64") // 10**9).tolist()
+    else:
+        times = local.dt.strftime("%Y-%m-%dT%H:%M").tolist()
+
+    hourly = {"time": times}
+    for variable in variables:
+        hourly[variable] = _to_json_list(df[variable])
+
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "generationtime_ms": round((time.perf_counter() - start) * 1000, 3),
+        "utc_offset_seconds": int(local.iloc[0].utcoffset().total_seconds()) if len(local) else 0,
+        "timezone": LOCAL_TZ,
+        "timezone_abbreviation": local.iloc[0].tzname() if len(local) else "",
+        "elevation": 0.0,
+        "hourly_units": {"time": timeformat, **{v: UNITS.get(v, "") for v in variables}},
+        "hourly": hourly,
+    }
+
+
+def make_handler(provider, latency_ms=0):
+
+    class ArchiveHandler(BaseHTTPRequestHandler):
+
+        def _send(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/v1/archive":
+                self._send(404, {"error": True, "reason": f"Unknown path {url.path}"})
+                return
+
+            query = parse_qs(url.query)
+            if _split(query, "format", ["json"])[0] != "json":
+                self._send(400, {"error": True, "reason": "The stand-in only serves format=json"})
+                return
+
+            try:
+                latitudes = [float(v) for v in _split(query, "latitude")]
+                longitudes = [float(v) for v in _split(query, "longitude")]
+                start_date = _split(query, "start_date")[0]
+                end_date = _split(query, "end_date")[0]
+            except (TypeError, ValueError):
+                self._send(400, {"error": True, "reason": "latitude, longitude, start_date and end_date are required"})
+                return
+            if len(latitudes) != len(longitudes):
+                self._send(400, {"error": True, "reason": "latitude and longitude must have the same number of elements"})
+                return
+
+            variables = _split(query, "hourly", WEATHER_VARIABLES)
+            timeformat = _split(query, "timeformat", ["iso8601"])[0]
+
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+            try:
+                results = [
+                    build_response(provider, lat, lon, start_date, end_date, variables, timeformat)
+                    for lat, lon in zip(latitudes, longitudes)
+                ]
+            except ValueError as e:
+                self._send(400, {"error": True, "reason": str(e)})
+                return
+            # Like the real API: one object for a single location, a list for several
+            self._send(200, results[0] if len(results) == 1 else results)
+
+        def log_message(self, format, *args):
+            pass
+
+    return ArchiveHandler
+
+
+def start_server(source="csv", host="127.0.0.1", port=8765, latency_ms=0):
+    """Start the stand-in in a background thread. Returns the server (call .shutdown() to stop it)."""
+    server = ThreadingHTTPServer((host, port), make_handler(get_weather_provider(source), latency_ms))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the Open-Meteo archive API")
+    parser.add_argument("--source", choices=["csv", "synthetic"], default="csv")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0, help="artificial delay per request")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(get_weather_provider(args.source), args.latency_ms))
+    print(f"Open-Meteo stand-in ({args.source}) on http://{args.host}:{args.port}/v1/archive")
+    server.serve_forever()
@@ -0,0 +1,210 @@
+"""
+DCT-based SPC outlier detection, split into stages so widget changes only redo the cheap part:
+
+ 1. spectral stage  `dct_spectrum(values)`            : NaN-filled signal + orthonormal DCT coefficients
+ 2. cutoff stage    `spc_bands(spectrum, W_filter)`   : low-pass trend and robust SD of the high-pass part (SATV)
+ 3. threshold stage `spc_outliers(bands, coef_k)`     : |signal - trend| > k * SD
+
+`spc_sweep` evaluates the outlier counts for a whole grid of cutoffs and k values at once
+(one batched idct per cutoff grid, sorted deviations per cutoff), for sensitivity curves.
+
+The frequency axis is W = linspace(0, 1/2, N) cycles/hour; the high-pass part keeps W >= W_filter
+and the trend W <= W_filter, as in the original plot_outlier_detection_dct.
+
+`spc_batch` runs the same detector on many equally long series at once (rows of a 2-D array):
+one dct/idct along the rows, per-row MAD and one vectorized threshold.
+
+`StreamingSpc` is the online counterpart for hourly feeds: a rolling trend and a streaming robust
+scale in bounded memory, flagging each new hour in O(1) without transforming the history.
+"""
+
+import numpy as np
+from scipy.fft import dct, idct
+
+# Scale of the median absolute deviation to the SD of a normal distribution
+MAD_TO_SD = 1.4826
+
+
+class DctSpectrum:
+
+    def __init__(self, signal, coefficients):
+        self.signal = signal
+        self.coefficients = coefficients
+        self.frequencies = np.linspace(0, 1 / 2, len(signal))  # cycles/hour
+
+    def __len__(self):
+        return len(self.signal)
+
+
+class SpcBands:
+
+    def __init__(self, signal, trend, sd, W_filter):
+        self.signal = signal
+        self.trend = trend
+        self.sd = sd
+        self.W_filter = W_filter
+        self.deviation = np.abs(signal - trend)
+
+
+def dct_spectrum(values):
+    """Spectral stage: the signal (NaN filled with its mean) and its orthonormal DCT."""
+    signal = np.asarray(values, dtype=np.float64)
+    if np.isnan(signal).any():
+        signal = np.nan_to_num(signal, nan=np.nanmean(signal))
+    return DctSpectrum(signal, dct(signal, norm="ortho"))
+
+
+def _filtered(coefficients, keep):
+    """idct of the coefficients where `keep` (rows of a 2-D mask give one filtered signal each)."""
+    return idct(np.where(keep, coefficients, 0.0), norm="ortho", axis=-1)
+
+
+def _robust_sd(satv):
+    """MAD-based SD along the last axis."""
+    median = np.median(satv, axis=-1, keepdims=True)
+    return np.median(np.abs(satv - median), axis=-1) * MAD_TO_SD
+
+
+def spc_bands(spectrum, W_filter):
+    """Cutoff stage: low-pass trend and robust SD of the high-pass signal (two inverse transforms)."""
+    W = spectrum.frequencies
+    satv = _filtered(spectrum.coefficients, W >= W_filter)
+    trend = _filtered(spectrum.coefficients, W <= W_filter)
+    return SpcBands(spectrum.signal, trend, float(_robust_sd(satv)), W_filter)
+
+
+def spc_outliers(bands, coef_k):
+    """Threshold stage: boolean mask of the points outside trend ± k * SD."""
+    return bands.deviation > coef_k * bands.sd
+
+
+def spc_sweep(spectrum, coef_ks, cutoffs):
+    """
+    Outlier counts for every (cutoff, k) pair: an array of shape (len(cutoffs), len(coef_ks)).
+    All cutoffs are filtered in one batched idct; per cutoff the deviations are sorted once and
+    every k is a binary search.
+    """
+    coef_ks = np.asarray(coef_ks, dtype=np.float64)
+    cutoffs = np.asarray(cutoffs, dtype=np.float64)
+    W = spectrum.frequencies
+    satv = _filtered(spectrum.coefficients, W[None, :] >= cutoffs[:, None])
+    trend = _filtered(spectrum.coefficients, W[None, :] <= cutoffs[:, None])
+    sd = _robust_sd(satv)
+    deviation = np.sort(np.abs(spectrum.signal[None, :] - trend), axis=1)
+
+    n = len(spectrum)
+    counts = np.empty((len(cutoffs), len(coef_ks)), dtype=np.int64)
+    for i in range(len(cutoffs)):
+        counts[i] = n - np.searchsorted(deviation[i], coef_ks * sd[i], side="right")
+    return counts
+
+
+def spc_batch(values, W_filter, coef_k):
+    """
+    DCT-SPC of every row of a 2-D array (series of equal length, NaN filled with the row mean).
+    Returns (outliers, signal, trend, sd): boolean and float arrays of the input shape, sd per row.
+    Rows without any value get sd NaN and no outliers.
+    """
+    signal = np.array(values, dtype=np.float64, ndmin=2)
+    missing = np.isnan(signal)
+    empty = missing.all(axis=1)
+    if missing.any():
+        counts = np.maximum((~missing).sum(axis=1), 1)
+        row_mean = np.where(missing, 0.0, signal).sum(axis=1) / counts
+        signal = np.where(missing, row_mean[:, None], signal)
+    coefficients = dct(signal, norm="ortho", axis=1)
+    W = np.linspace(0, 1 / 2, signal.shape[1])
+    satv = _filtered(coefficients, W >= W_filter)
+    trend = _filtered(coefficients, W <= W_filter)
+    sd = np.where(empty, np.nan, _robust_sd(satv))
+    with np.errstate(invalid="ignore"):
+        outliers = np.abs(signal - trend) > coef_k * sd[:, None]
+    return outliers, signal, trend, sd
+
+
+class StreamingSpc:
+    """
+    Online SPC for hourly observations of one or more series (columns), in bounded memory:
+     - trend: trailing moving average over `trend_hours` (ring buffer + running sum, O(1) per hour),
+       the streaming counterpart of the DCT low-pass with W_filter = 1 / trend_hours
+     - scale: streaming estimate of the median absolute residual (multiplicative stochastic quantile
+       update after a warm-up on the mean absolute residual), times 1.4826
+     - flag: |x - trend| > coef_k * scale, with trend and scale taken from the hours before x
+    NaN observations are skipped (never flagged, state unchanged).
+    """
+
+    # median |r| / mean |r| of a normal distribution, for the warm-up estimate
+    _MEDIAN_TO_MEAN_ABS = 0.6745 / 0.7979
+
+    def __init__(self, n_series=1, trend_hours=240, coef_k=3.0, learning_rate=0.02, warmup=None):
+        self.n_series = n_series
+        self.trend_hours = trend_hours
+        self.coef_k = coef_k
+        self.learning_rate = learning_rate
+        self.warmup = warmup or trend_hours
+        self._window = np.full((trend_hours, n_series), np.nan)
+        self._pos = 0
+        self._sum = np.zeros(n_series)
+        self._count = np.zeros(n_series, dtype=np.int64)
+        self._abs_sum = np.zeros(n_series)
+        self._residuals = np.zeros(n_series, dtype=np.int64)
+        self.median_abs = np.full(n_series, np.nan)
+        self.seen = np.zeros(n_series, dtype=np.int64)
+
+    @property
+    def nbytes(self):
+        return self._window.nbytes + 6 * self.n_series * 8
+
+    @property
+    def trend(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self._count > 0, self._sum / self._count, np.nan)
+
+    @property
+    def sd(self):
+        return self.median_abs * MAD_TO_SD
+
+    def update(self, x):
+        """Feed one hour (one value per series). Returns (flags, trend, sd) as used for this hour."""
+        x = np.asarray(x, dtype=np.float64).reshape(self.n_series)
+        valid = ~np.isnan(x)
+        trend, sd = self.trend, self.sd
+        residual = np.abs(x - trend)
+        has_residual = valid & ~np.isnan(residual)
+
+        ready = has_residual & (self.seen >= self.warmup)
+        flags = ready & (residual > self.coef_k * sd)
+
+        # Scale: mean absolute residual during the warm-up, then a stochastic median update
+        warming = has_residual & (self._residuals < self.warmup)
+        self._abs_sum[warming] += residual[warming]
+        self._residuals[warming] += 1
+        self.median_abs[warming] = self._abs_sum[warming] / self._residuals[warming] * self._MEDIAN_TO_MEAN_ABS
+        tracking = has_residual & ~warming
+        step = np.where(residual[tracking] > self.median_abs[tracking], self.learning_rate, -self.learning_rate)
+        self.median_abs[tracking] *= np.exp(step)
+
+        # Trend: replace the oldest hour of the ring buffer
+        old = self._window[self._pos]
+        had = ~np.isnan(old)
+        self._sum[had] -= old[had]
+        self._count[had] -= 1
+        self._window[self._pos] = x
+        self._sum[valid] += x[valid]
+        self._count[valid] += 1
+        self._pos = (self._pos + 1) % self.trend_hours
+        if self._pos == 0:
+            # re-sum once per window so rounding errors of the running sum do not accumulate
+            self._sum = np.nansum(self._window, axis=0)
+        self.seen[valid] += 1
+        return flags, trend, sd
+
+    def update_many(self, rows):
+        """Feed several hours (an array of shape (hours, n_series)). Returns (flags, trend, sd) arrays of that shape."""
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, self.n_series)
+        flags = np.zeros(rows.shape, dtype=bool)
+        trend = np.empty(rows.shape)
+        sd = np.empty(rows.shape)
+        for i, x in enumerate(rows):
+            flags[i], trend[i], sd[i] = self.update(x)
+        return flags, trend, sd
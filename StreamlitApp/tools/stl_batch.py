@@ -0,0 +1,102 @@
+"""
+Batch STL decomposition with cached components.
+
+An StlEngine decomposes series in a process pool and keeps the trend/seasonal/resid arrays in a
+byte-bounded LRU cache keyed by the series content and the STL parameters:
+ - `submit_many` queues a batch (e.g. every area/group series of a year) without waiting
+ - `components` returns the components of one series: from the cache, from its queued job, or
+   computed right away when it was never queued (so a parameter change only fits the selected series)
+
+This module has no Streamlit dependency: the app keeps one engine per worker (tools.utils.stl_engine).
+"""
+
+import hashlib
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from statsmodels.tsa.seasonal import STL
+
+from tools.chunk_cache import ChunkCache
+
+STL_COMPONENTS = ("trend", "seasonal", "resid")
+
+
+def series_digest(values):
+    """Content key of a series (float64 bytes), so a refreshed series is never served stale components."""
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return hashlib.blake2b(values.tobytes(), digest_size=16).hexdigest()
+
+
+def stl_components(values, period, seasonal, trend, robust):
+    """Fit STL on one series; returns {"trend", "seasonal", "resid"} as read-only float64 arrays."""
+    res = STL(np.asarray(values, dtype=np.float64), period=period, seasonal=seasonal, trend=trend, robust=robust).fit()
+    components = {}
+    for name in STL_COMPONENTS:
+        array = np.ascontiguousarray(getattr(res, name), dtype=np.float64)
+        array.flags.writeable = False
+        components[name] = array
+    return components
+
+
+class StlEngine:
+
+    def __init__(self, max_bytes=256 * 1024**2, max_workers=None):
+        self.cache = ChunkCache(max_bytes=max_bytes)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = None
+        self._pending = {}   # cache key -> Future
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(values, period, seasonal, trend, robust):
+        return (series_digest(values), int(period), int(seasonal), int(trend), bool(robust))
+
+    def _executor(self):
+        if self._pool is None:
+            # spawned workers: forking the multi-threaded app server is unsafe
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _store(self, key, future):
+        with self._lock:
+            self._pending.pop(key, None)
+        if not future.cancelled() and future.exception() is None:
+            self.cache.put(key, future.result())
+
+    def submit_many(self, series, period, seasonal, trend, robust):
+        """Queue the decomposition of every series (an iterable of arrays) not cached or queued yet. Returns the number queued."""
+        queued = 0
+        for values in series:
+            key = self.key(values, period, seasonal, trend, robust)
+            with self._lock:
+                if key in self._pending or key in self.cache:
+                    continue
+                future = self._executor().submit(stl_components, np.asarray(values, dtype=np.float64),
+                                                 period, seasonal, trend, robust)
+                self._pending[key] = future
+            future.add_done_callback(lambda f, key=key: self._store(key, f))
+            queued += 1
+        return queued
+
+    def components(self, values, period, seasonal, trend, robust):
+        """Components of one series: cached, awaited from its queued job, or fitted here."""
+        key = self.key(values, period, seasonal, trend, robust)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            future = self._pending.get(key)
+        # A job still waiting in the queue is fitted here instead of behind the rest of the batch
+        if future is not None and not future.cancel():
+            return future.result()
+        components = stl_components(values, period, seasonal, trend, robust)
+        self.cache.put(key, components)
+        return components
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -1,131 +1,645 @@
 import pandas as pd
+from pandas.api.types import union_categoricals
 import streamlit as st
-import openmeteo_requests
-import pandas as pd
-import requests_cache
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import numpy as np
-from retry_requests import retry
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import pymongo
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-from statsmodels.tsa.seasonal import STL
-from scipy.fft import dct, idct
-import scipy.stats as stats
-from sklearn.neighbors import LocalOutlierFactor
 from scipy.signal import stft
 
+from tools import weather_store
+from tools.chunk_cache import ChunkCache
+from tools.elhub_backend import DEFAULT_BACKEND, get_elhub_backend, as_list as _as_list, output_columns, sort_by_time
+from tools.elhub_rollups import ELHUB_COLLECTIONS
+from tools.elhub_indexes import check_deployment
+from tools.weather_provider import get_weather_provider, fetch_batched, snap_to_grid, WEATHER_VARIABLES
+from tools.weather_frame import WeatherFrame
+from tools.energy_cube import EnergyCube
+from tools.stl_batch import StlEngine
+from tools.lof import neighbour_graph, joint_neighbour_graph, standardize, lof_scores, lof_outliers
+from tools.spc import dct_spectrum, spc_bands, spc_outliers, spc_sweep, spc_batch, StreamingSpc
+
 ################################### 1.Get the data from API ###################################
 
-@st.cache_data
-def load_data_fromAPI(longitude, latitude, selected_year):
-	# Setup the Open-Meteo API client with cache and retry on error
-	cache_session = requests_cache.CachedSession('.cache', expire_after = -1)
-	retry_session = retry(cache_session, retries = 5, backoff_factor = 0.2)
-	openmeteo = openmeteo_requests.Client(session = retry_session)
-
-	# Make sure all required weather variables are listed here
-	# The order of variables in hourly or daily is important to assign them correctly below
-	url = "https://archive-api.open-meteo.com/v1/archive"
-	params = {
-		"latitude": latitude,
-		"longitude": longitude,
-        "start_date": f"{selected_year}-01-01",
-        "end_date": f"{selected_year}-12-31",
-		"hourly": ["temperature_2m", "wind_speed_10m", "wind_gusts_10m", "wind_direction_10m", "precipitation"],
-		"models": "era5",
-		"timezone": "auto",
-        "wind_speed_unit": "ms",
-	}
-	responses = openmeteo.weather_api(url, params=params)
-
-	# Process first location. Add a for-loop for multiple locations or weather models
-	response = responses[0]
-	print(f"Coordinates: {response.Latitude()}°N {response.Longitude()}°E")
-	print(f"Date_range: {params['start_date']} - {params['end_date']}")
-	print(f"Variables: {params['hourly']}")
-	#print(f"Elevation: {response.Elevation()} m asl")
-	#print(f"Timezone difference to GMT+0: {response.UtcOffsetSeconds()}s")
-
-	# Process hourly data. The order of variables needs to be the same as requested.
-	hourly = response.Hourly()
-	hourly_temperature_2m = hourly.Variables(0).ValuesAsNumpy()
-	hourly_wind_speed_10m = hourly.Variables(1).ValuesAsNumpy()
-	hourly_wind_gusts_10m = hourly.Variables(2).ValuesAsNumpy()
-	hourly_wind_direction_10m = hourly.Variables(3).ValuesAsNumpy()
-	hourly_precipitation = hourly.Variables(4).ValuesAsNumpy()
-
-	hourly_data = {"date": pd.date_range(
-		start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
-		end =  pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
-		freq = pd.Timedelta(seconds = hourly.Interval()),
-		inclusive = "left"
-	)}
-
-	hourly_data["temperature_2m"] = hourly_temperature_2m
-	hourly_data["wind_speed_10m"] = hourly_wind_speed_10m
-	hourly_data["wind_gusts_10m"] = hourly_wind_gusts_10m
-	hourly_data["wind_direction_10m"] = hourly_wind_direction_10m
-	hourly_data["precipitation"] = hourly_precipitation
-
-	hourly_dataframe = pd.DataFrame(data = hourly_data)
-	# Change the time zone to Europe/Oslo
-	hourly_dataframe["date"] = hourly_dataframe["date"].dt.tz_convert("Europe/Oslo")
-	hourly_dataframe = hourly_dataframe[hourly_dataframe["date"].dt.year == int(selected_year)]
-	print(f"Sucessfully load the data")
-	
-	return hourly_dataframe
+def _tidy_weather(hourly_dataframe, start_date, end_date):
+    """Europe/Oslo timestamps, requested local dates only, one row per hour, in time order."""
+    # Change the time zone to Europe/Oslo
+    hourly_dataframe["date"] = hourly_dataframe["date"].dt.tz_convert("Europe/Oslo")
+
+    local_day = hourly_dataframe["date"].dt.tz_localize(None).dt.normalize()
+    hourly_dataframe = hourly_dataframe[(local_day >= pd.Timestamp(start_date)) & (local_day <= pd.Timestamp(end_date))]
+    return (
+        hourly_dataframe.drop_duplicates(subset="date")
+        .sort_values("date")
+        .reset_index(drop=True)
+    )
+
+
+def _trim_missing_tail(hourly_dataframe):
+    """Drop trailing hours without any value (the archive lags a few days behind real time)."""
+    has_value = hourly_dataframe.drop(columns="date").notna().any(axis=1).to_numpy()
+    valid = np.flatnonzero(has_value)
+    return hourly_dataframe.iloc[: valid[-1] + 1] if len(valid) else hourly_dataframe.iloc[:0]
+
+
+def _today():
+    return pd.Timestamp.now(tz="Europe/Oslo").tz_localize(None).normalize()
+
+
+def _needed_variables(provider, cell, year, variables):
+    """Requested variables that are not stored yet for this cell and year."""
+    stored = weather_store.stored_columns(*cell, year, source=provider.name)
+    if stored is None:
+        return tuple(variables)
+    return tuple(v for v in variables if v not in stored)
+
+
+def _year_end(year):
+    """Last local hour of a year."""
+    return pd.Timestamp(f"{int(year)}-12-31 23:00").tz_localize("Europe/Oslo")
+
+
+def _complete_past_years(provider, cells, years):
+    """
+    Past years stored before their last days were in the archive (it lags a few days behind real
+    time) are completed from their last stored hour, for the columns they hold. A year that is
+    still short is retried at most once per REFRESH_EVERY. Returns True when hours were added.
+    """
+    now = pd.Timestamp.now(tz="Europe/Oslo")
+    checked = _live_weather()["backfill"]
+    pending = {}
+    for cell in cells:
+        for year in years:
+            last_check = checked.get((provider.spec, cell, year))
+            if year >= now.year or (last_check is not None and now - last_check < REFRESH_EVERY):
+                continue
+            last = weather_store.last_hour(*cell, year, source=provider.name)
+            if last is None or last >= _year_end(year):
+                continue
+            checked[(provider.spec, cell, year)] = now
+            columns = tuple(weather_store.stored_columns(*cell, year, source=provider.name))
+            pending.setdefault((last.strftime("%Y-%m-%d"), year, columns), []).append((cell, last))
+
+    added = False
+    for (start_date, year, columns), entries in pending.items():
+        end_date = f"{year}-12-31"
+        frames = fetch_batched(provider, [cell for cell, _ in entries], start_date, end_date, list(columns))
+        for ((latitude, longitude), last), df_tail in zip(entries, frames):
+            df_tail = _tidy_weather(df_tail, start_date, end_date)
+            df_tail = _trim_missing_tail(df_tail[df_tail["date"] > last])
+            added |= bool(weather_store.append_frame(latitude, longitude, df_tail, source=provider.name))
+    return added
+
+
+def _fill_store(provider, cells, years, variables):
+    """
+    Fetch whatever the store is missing for these cells, years and variables:
+    the missing last days of past years, whole partitions for new years, and only the missing
+    columns for years that are already stored.
+    Cells that miss the same variables over the same run of years share batched requests.
+    """
+    if _complete_past_years(provider, cells, years):
+        # cached series of those years were served without their final hours
+        _load_weather_range.clear()
+        _load_weather_frame.clear()
+
+    pending = {}
+    for cell in cells:
+        # Split the years into runs of consecutive years that miss the same variables
+        runs = []
+        for year in years:
+            needed = _needed_variables(provider, cell, year, variables)
+            if not needed:
+                continue
+            if runs and runs[-1][1] == needed and runs[-1][0][-1] == year - 1:
+                runs[-1][0].append(year)
+            else:
+                runs.append(([year], needed))
+        for run, needed in runs:
+            pending.setdefault((tuple(run), needed), []).append(cell)
+
+    for (run, needed), run_cells in pending.items():
+        # The current year is fetched up to today; refresh_weather_tail keeps it up to date afterwards
+        start_date = f"{run[0]}-01-01"
+        end_date = min(pd.Timestamp(f"{run[-1]}-12-31"), _today()).strftime("%Y-%m-%d")
+        if start_date > end_date:
+            continue
+        frames = fetch_batched(provider, run_cells, start_date, end_date, list(needed))
+        for (latitude, longitude), df_run in zip(run_cells, frames):
+            df_run = _trim_missing_tail(_tidy_weather(df_run, start_date, end_date))
+            weather_store.merge_frame(latitude, longitude, df_run, years=run, source=provider.name)
+        print(f"Sucessfully load the data: {list(needed)} for {len(run_cells)} location(s)")
+
+
+def _select_range(hourly_dataframe, start_date, end_date, variables):
+    """Rows of the local dates start_date..end_date and the requested columns."""
+    local_day = hourly_dataframe["date"].dt.tz_localize(None).dt.normalize()
+    mask = (local_day >= pd.Timestamp(start_date)) & (local_day <= pd.Timestamp(end_date))
+    return hourly_dataframe.loc[mask, ["date"] + list(variables)].reset_index(drop=True)
+
+
+def _read_weather_range(provider_spec, longitude, latitude, start_date, end_date, variables):
+    provider = get_weather_provider(provider_spec)
+    years = list(range(int(start_date[:4]), int(end_date[:4]) + 1))
+
+    # 1. Fetch what is not in the local store yet (missing years or missing columns)
+    _fill_store(provider, [(latitude, longitude)], years, variables)
+
+    # 2. Serve the whole range from the store, reading only the requested columns
+    frames = [weather_store.read_year(latitude, longitude, year, columns=list(variables), source=provider.name) for year in years]
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=["date"] + list(variables))
+    hourly_dataframe = _select_range(pd.concat(frames, ignore_index=True), start_date, end_date, variables)
+    hourly_dataframe.attrs["grid_cell"] = (latitude, longitude)
+    return hourly_dataframe
+
+
+# Keyed on ERA5 grid cells, so the number of cached series stays small and bounded
+@st.cache_data(max_entries=256)
+def _load_weather_range(provider_spec, longitude, latitude, start_date, end_date, variables):
+    return _read_weather_range(provider_spec, longitude, latitude, start_date, end_date, variables)
+
+
+# Shared (not copied per session) compact frames; their arrays are read-only
+@st.cache_resource(max_entries=256)
+def _load_weather_frame(provider_spec, longitude, latitude, start_date, end_date, variables):
+    return WeatherFrame.from_dataframe(_read_weather_range(provider_spec, longitude, latitude, start_date, end_date, variables))
+
+
+def get_weather_cell(latitude, longitude):
+    """The ERA5 grid cell (latitude, longitude) whose weather is used for a point."""
+    return snap_to_grid(latitude, longitude)
+
+
+def _normalize_request(start_date, end_date, variables):
+    start_date = pd.Timestamp(start_date).strftime("%Y-%m-%d")
+    end_date = pd.Timestamp(end_date).strftime("%Y-%m-%d")
+    if end_date < start_date:
+        raise ValueError("end_date must not be earlier than start_date")
+    # A tuple keeps the cache key hashable; duplicates are dropped, order is kept
+    variables = tuple(dict.fromkeys(variables or WEATHER_VARIABLES))
+    return start_date, end_date, variables
+
+
+# How often a current-year series is checked for new hours
+REFRESH_EVERY = pd.Timedelta(hours=1)
+
+@st.cache_resource
+def _live_weather():
+    """Current-year frames shared by all sessions, extended in place by refresh_weather_tail."""
+    return {"frames": {}, "checked": {}, "spc": {}, "backfill": {}, "lock": threading.Lock()}
+
+
+# Recent flagged hours kept per location by the streaming SPC of the live tail
+LIVE_SPC_OUTLIERS = 1000
+
+
+def _check_live_tail(live, key, history, df_tail, variables):
+    """
+    Quality-check appended hours with the location's StreamingSpc (all variables as columns):
+    O(1) per new hour, no re-transform of the stored history. The detector of a location is warmed
+    up once on the latest stored hours only. Flagged hours are kept in a bounded list.
+    """
+    variables = [v for v in variables if v in df_tail.columns]
+    entry = live["spc"].get(key)
+    if entry is None or entry["variables"] != variables:
+        detector = StreamingSpc(n_series=len(variables))
+        if history is not None and not history.empty:
+            warm = history.reindex(columns=variables).tail(2 * detector.trend_hours)
+            detector.update_many(warm.to_numpy(float))
+        entry = {"detector": detector, "variables": variables, "outliers": deque(maxlen=LIVE_SPC_OUTLIERS)}
+        live["spc"][key] = entry
+
+    flags, trend, sd = entry["detector"].update_many(df_tail[variables].to_numpy(float))
+    hours, columns = np.nonzero(flags)
+    for h, c in zip(hours, columns):
+        entry["outliers"].append({
+            "date": df_tail["date"].iloc[h], "variable": variables[c],
+            "value": float(df_tail[variables[c]].iloc[h]), "trend": trend[h, c], "sd": sd[h, c],
+        })
+    return len(hours)
+
+
+def live_weather_outliers(longitude, latitude):
+    """Hours flagged by the streaming SPC since the app started refreshing this location (newest last)."""
+    latitude, longitude = get_weather_cell(latitude, longitude)
+    live = _live_weather()
+    with live["lock"]:
+        entry = live["spc"].get((get_weather_provider().spec, latitude, longitude))
+        rows = list(entry["outliers"]) if entry is not None else []
+    return pd.DataFrame(rows, columns=["date", "variable", "value", "trend", "sd"])
+
+
+def refresh_weather_tail(longitude, latitude, force=False, variables=None):
+    """
+    Fetch only the hours after the last stored hour of a location (for the variables it has stored)
+    and append them to the local store and to the in-memory current-year frame.
+    A location with nothing stored gets the current year of `variables` (default: WEATHER_VARIABLES).
+    Returns the number of new hours. Without `force`, a location is checked at most once per REFRESH_EVERY.
+    """
+    provider = get_weather_provider()
+    latitude, longitude = get_weather_cell(latitude, longitude)
+    key = (provider.spec, latitude, longitude)
+    now = pd.Timestamp.now(tz="Europe/Oslo")
+    year = now.year
+    live = _live_weather()
+
+    with live["lock"]:
+        last_check = live["checked"].get(key)
+        if not force and key in live["frames"] and now - last_check < REFRESH_EVERY:
+            return 0
+        live["checked"][key] = now
+
+        # The last stored hour may still be in last year's partition right after new year
+        last_year = year
+        last = weather_store.last_hour(latitude, longitude, year, source=provider.name)
+        if last is None:
+            last_year = year - 1
+            last = weather_store.last_hour(latitude, longitude, last_year, source=provider.name)
+        if last is None:
+            variables = list(variables or WEATHER_VARIABLES)
+            _fill_store(provider, [(latitude, longitude)], [year], variables)
+            df_new = weather_store.read_year(latitude, longitude, year, source=provider.name)
+            live["frames"][key] = df_new if df_new is not None else pd.DataFrame(columns=["date"] + variables)
+            return len(live["frames"][key])
+
+        # Only the missing tail is requested: from the day of the last stored hour up to today
+        variables = weather_store.stored_columns(latitude, longitude, last_year, source=provider.name)
+        start_date = last.strftime("%Y-%m-%d")
+        end_date = now.strftime("%Y-%m-%d")
+        df_tail = fetch_batched(provider, [(latitude, longitude)], start_date, end_date, variables)[0]
+        df_tail = _tidy_weather(df_tail, start_date, end_date)
+        df_tail = _trim_missing_tail(df_tail[df_tail["date"] > last])
+        touched = weather_store.append_frame(latitude, longitude, df_tail, source=provider.name)
+        if year - 1 in touched:
+            # last year's cached series got its final hours
+            _load_weather_range.clear()
+            _load_weather_frame.clear()
+
+        if not df_tail.empty:
+            history = live["frames"].get(key)
+            if key not in live["spc"] and history is None:
+                history = weather_store.read_year(latitude, longitude, last_year, source=provider.name)
+                if history is not None:
+                    history = history[history["date"] <= last]  # the store already holds the new hours
+            _check_live_tail(live, key, history, df_tail, variables)
+
+        df_tail = df_tail[df_tail["date"].dt.year == year]
+        frame = live["frames"].get(key)
+        if frame is None:
+            frame = weather_store.read_year(latitude, longitude, year, source=provider.name)
+        elif not df_tail.empty:
+            frame = pd.concat([frame, df_tail], ignore_index=True)
+        live["frames"][key] = frame if frame is not None else pd.DataFrame(columns=["date"] + list(variables))
+        return len(df_tail)
+
+
+def _current_year_frame(provider, latitude, longitude, variables):
+    """The live current-year frame of a cell, holding at least the requested variables."""
+    year = _today().year
+    key = (provider.spec, latitude, longitude)
+    # The tail first: right after new year it completes last year from its last stored hour,
+    # before _fill_store creates the new year's partition
+    refresh_weather_tail(longitude, latitude, variables=variables)
+    _fill_store(provider, [(latitude, longitude)], [year], variables)
+
+    live = _live_weather()
+    with live["lock"]:
+        frame = live["frames"][key]
+        if frame.empty or any(v not in frame.columns for v in variables):
+            # the year or some columns were added to the store since the live frame was built
+            frame = weather_store.read_year(latitude, longitude, year, source=provider.name)
+            live["frames"][key] = frame
+    return frame
+
+
+def load_weather_range(longitude, latitude, start_date, end_date, variables=None):
+    """
+    Load hourly weather between two dates (inclusive, Europe/Oslo), reading the local store first.
+    Only `variables` (default: WEATHER_VARIABLES) are fetched, stored and returned; variables added
+    later are fetched on their own and merged into the stored years.
+    The point is snapped to its ERA5 grid cell; the cell used is in `df.attrs["grid_cell"]`.
+    Ranges reaching into the current year get their latest hours through refresh_weather_tail.
+    """
+    latitude, longitude = get_weather_cell(latitude, longitude)
+    start_date, end_date, variables = _normalize_request(start_date, end_date, variables)
+    provider = get_weather_provider()
+
+    # Completed years never change: serve them from the cache
+    year = _today().year
+    if int(end_date[:4]) < year:
+        return _load_weather_range(provider.spec, longitude, latitude, start_date, end_date, variables)
+
+    # The current year comes from the live frame, refreshed incrementally
+    frames = []
+    if int(start_date[:4]) < year:
+        frames.append(_load_weather_range(provider.spec, longitude, latitude, start_date, f"{year - 1}-12-31", variables))
+    frames.append(_current_year_frame(provider, latitude, longitude, variables))
+    hourly_dataframe = _select_range(pd.concat(frames, ignore_index=True), start_date, end_date, variables)
+    hourly_dataframe.attrs["grid_cell"] = (latitude, longitude)
+    return hourly_dataframe
+
+
+def load_data_fromAPI(longitude, latitude, selected_year, variables=None):
+    """Load one calendar year of hourly weather (kept for the single-year pages)."""
+    return load_weather_range(longitude, latitude, f"{selected_year}-01-01", f"{selected_year}-12-31", variables)
+
+
+def load_weather_frame(longitude, latitude, start_date, end_date, variables=None):
+    """
+    Same data as load_weather_range, as a compact WeatherFrame (float32 arrays, epoch-hour index,
+    month/year offsets). Completed years are shared between sessions without copies.
+    """
+    latitude, longitude = get_weather_cell(latitude, longitude)
+    start_date, end_date, variables = _normalize_request(start_date, end_date, variables)
+    provider = get_weather_provider()
+    if int(end_date[:4]) < _today().year:
+        return _load_weather_frame(provider.spec, longitude, latitude, start_date, end_date, variables)
+    # The current year keeps growing, so its frame is rebuilt from the live series
+    return WeatherFrame.from_dataframe(load_weather_range(longitude, latitude, start_date, end_date, variables))
+
+
+def warm_price_area_weather(start_year, end_year=None, variables=None):
+    """Fill the weather store for every price-area city in one batched request (only file checks once stored)."""
+    end_year = end_year or start_year
+    basic_info = get_basic_info()
+    cells = sorted({get_weather_cell(lat, lon) for lat, lon in zip(basic_info["latitude"], basic_info["longitude"])})
+    years = list(range(int(start_year), int(end_year) + 1))
+    _fill_store(get_weather_provider(), cells, years, variables or WEATHER_VARIABLES)
+    return len(cells)
 
 ################################### 2.Get the data from MongoDB ###################################
 # Initialize connection.
 # Uses st.cache_resource to only run once.
+# Optional client settings in st.secrets["mongo"] (pymongo option names), with their defaults
+MONGO_CLIENT_OPTIONS = {
+    "maxPoolSize": 20,
+    "minPoolSize": 0,
+    "serverSelectionTimeoutMS": 10_000,
+    "connectTimeoutMS": 10_000,
+    "socketTimeoutMS": 120_000,
+    "readPreference": "primaryPreferred",
+    # zlib wire compression: Elhub batches are highly repetitive and compress well
+    "compressors": "zlib",
+}
+
 @st.cache_resource
 def init_connection():
-    return pymongo.MongoClient(st.secrets["mongo"]["uri"])
+    settings = st.secrets["mongo"]
+    options = {name: settings.get(name, default) for name, default in MONGO_CLIENT_OPTIONS.items()}
+    client = pymongo.MongoClient(settings["uri"], **options)
+    # Startup check: supporting indexes exist and the app's queries do not scan whole collections
+    if settings.get("check_indexes", True):
+        try:
+            check_deployment(client['elhub_db'], create=settings.get("create_indexes", True))
+        except pymongo.errors.PyMongoError as e:
+            print(f"Elhub index check failed: {e}")
+    return client
+
+
+def elhub_backend_spec():
+    """Elhub storage backend: $ELHUB_BACKEND, else st.secrets["elhub"]["backend"], else "mongo"."""
+    if os.environ.get("ELHUB_BACKEND"):
+        return os.environ["ELHUB_BACKEND"]
+    try:
+        return st.secrets["elhub"]["backend"]
+    except (KeyError, FileNotFoundError):
+        return DEFAULT_BACKEND
+
+
+def elhub_backend(spec=None):
+    """The Elhub backend serving get_elhub_data and the aggregations (see tools/elhub_backend.py)."""
+    return get_elhub_backend(spec or elhub_backend_spec(), connect=init_connection)
+
+
+# Elhub rows are cached per dataset and calendar month, shared by all sessions of the worker
+ELHUB_CACHE_BYTES = 1024 * 1024**2
+# Months that may still receive data are refetched after this many seconds
+OPEN_MONTH_TTL = 7200
 
-# Pull data from the collection including production and consumption data
-# Uses st.cache_data to only rerun when the query changes or after 10 min.
-@st.cache_data(ttl=7200)
-def get_elhub_data(start_dt, end_dt):
-    client = init_connection()
-    db = client['elhub_db']
-    # Load production data
-    # Query only the needed time range
-    # Normalize boundaries
-    start_dt = start_dt.replace(hour=0, minute=0, second=0, microsecond=0)
-    end_dt = end_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
-    query = {
-        "starttime": {
-            "$gte": start_dt,
-            "$lte": end_dt
-        }
+@st.cache_resource
+def _elhub_chunk_cache():
+    return ChunkCache(max_bytes=ELHUB_CACHE_BYTES)
+
+
+def _month_runs(months):
+    """Split sorted monthly periods into runs of consecutive months."""
+    runs = []
+    for month in months:
+        if runs and month == runs[-1][-1] + 1:
+            runs[-1].append(month)
+        else:
+            runs.append([month])
+    return runs
+
+
+def _fetch_month_chunks(backend, mode, months):
+    """
+    Fetch consecutive months of one dataset in a single read, sort the rows by starttime and
+    split them into monthly chunks at binary-searched month boundaries.
+    """
+    df = sort_by_time(backend.load_months(mode, months))
+    starttime = df["starttime"].to_numpy(dtype="datetime64[ns]")
+    bounds = np.searchsorted(starttime, [month.start_time.to_datetime64() for month in months + [months[-1] + 1]])
+    # Months without rows get an empty chunk, so they are not queried again
+    return {
+        month: df.iloc[bounds[i]:bounds[i + 1]].reset_index(drop=True)
+        for i, month in enumerate(months)
     }
-    # Production data
-    prod_items = list(
-        db["production_data"].find(query)
-    )
-    df_prod = pd.DataFrame(prod_items)
 
-    # Consumption data
-    cons_items = list(
-        db["consumption_data"].find(query)
-    )
-    df_cons = pd.DataFrame(cons_items)
 
-    # Standardize timestamp
-    if not df_prod.empty:
-        df_prod["starttime"] = pd.to_datetime(df_prod["starttime"])
-    if not df_cons.empty:
-        df_cons["starttime"] = pd.to_datetime(df_cons["starttime"])
+def _concat_chunks(chunks):
+    """Concatenate monthly chunks, keeping the categorical columns categorical."""
+    chunks = [chunk for chunk in chunks if not chunk.empty] or chunks[:1]
+    if len(chunks) == 1:
+        return chunks[0].copy()
+    for column in chunks[0].select_dtypes("category").columns:
+        categories = union_categoricals([chunk[column] for chunk in chunks]).categories
+        chunks = [chunk.assign(**{column: chunk[column].cat.set_categories(categories)}) for chunk in chunks]
+    return pd.concat(chunks, ignore_index=True)
+
+
+def _load_dataset_range(backend, cache, mode, start_dt, end_dt):
+    """
+    Rows of one dataset between start_dt and end_dt, fetching only the months missing from the chunk cache.
+    The chunks are time-sorted, so the result is sorted by starttime and trimmed by binary search.
+    """
+    months = list(pd.period_range(start_dt, end_dt, freq="M"))
+    chunks = {month: cache.get((backend.spec, mode, str(month))) for month in months}
+
+    missing = [month for month, chunk in chunks.items() if chunk is None]
+    now = pd.Timestamp.now(tz="Europe/Oslo").tz_localize(None)
+    for run in _month_runs(missing):
+        for month, chunk in _fetch_month_chunks(backend, mode, run).items():
+            chunks[month] = chunk
+            is_open = month.end_time >= now - pd.Timedelta(days=1)
+            cache.put((backend.spec, mode, str(month)), chunk, ttl=OPEN_MONTH_TTL if is_open else None)
+
+    df = _concat_chunks([chunks[month] for month in months])
+    starttime = df["starttime"].to_numpy(dtype="datetime64[ns]")
+    first = np.searchsorted(starttime, start_dt.to_datetime64(), "left")
+    last = np.searchsorted(starttime, end_dt.to_datetime64(), "right")
+    return df.iloc[first:last].reset_index(drop=True)
+
+
+def _dataset_range(backend, cache, mode, start_dt, end_dt):
+    """
+    Assembled range of one dataset, kept in the chunk cache next to its months so both count
+    against ELHUB_CACHE_BYTES. The frame is shared (not copied): callers must not modify it.
+    """
+    key = (backend.spec, mode, start_dt, end_dt)
+    df = cache.get(key)
+    if df is None:
+        df = _load_dataset_range(backend, cache, mode, start_dt, end_dt)
+        is_open = end_dt >= pd.Timestamp.now(tz="Europe/Oslo").tz_localize(None) - pd.Timedelta(days=1)
+        cache.put(key, df, ttl=OPEN_MONTH_TTL if is_open else None)
+    return df
+
+
+# Pull data from the collection including production and consumption data
+# Served from monthly chunks: only months not cached yet are queried.
+def get_elhub_data(start_dt, end_dt, datasets=("Production", "Consumption")):
+    """
+    Load the hourly Elhub rows of the requested datasets ("Production" and/or "Consumption").
+    The datasets are read concurrently from the configured backend (MongoDB or local Parquet).
+    A repeated range is served as the same shared frame; treat the frames as read-only.
+    Returns (df_prod, df_cons); a dataset that was not requested is an empty frame.
+    """
+    backend = elhub_backend()
+    cache = _elhub_chunk_cache()
+    # Normalize boundaries
+    start_dt = pd.Timestamp(start_dt).replace(hour=0, minute=0, second=0, microsecond=0)
+    end_dt = pd.Timestamp(end_dt).replace(hour=23, minute=59, second=59, microsecond=999999)
+    datasets = [mode for mode in ELHUB_COLLECTIONS if mode in datasets]
+    # The loader threads run in this session's ScriptRunContext (the Mongo client is a cached resource)
+    with ThreadPoolExecutor(max_workers=max(len(datasets), 1), initializer=add_script_run_ctx,
+                            initargs=(None, get_script_run_ctx())) as pool:
+        futures = {mode: pool.submit(_dataset_range, backend, cache, mode, start_dt, end_dt) for mode in datasets}
+    frames = {mode: future.result() for mode, future in futures.items()}
+    df_prod = frames.get("Production", pd.DataFrame())
+    df_cons = frames.get("Consumption", pd.DataFrame())
     return df_prod, df_cons
 
-def filter_time_window(df, start_date, end_date):
-    if df.empty:
-        return df
-    start_dt = pd.Timestamp(start_date)
-    end_dt = pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
-    return df[(df["starttime"] >= start_dt) & (df["starttime"] <= end_dt)]
+@st.cache_resource(ttl=OPEN_MONTH_TTL, max_entries=32)
+def _load_energy_cube(backend_spec, mode, start_dt, end_dt):
+    df_prod, df_cons = get_elhub_data(start_dt, end_dt, datasets=(mode,))
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    return EnergyCube.from_frame(df_prod if mode == "Production" else df_cons, group_field)
+
+
+def get_energy_cube(mode, start_dt, end_dt):
+    """
+    The hourly rows of one dataset as a dense EnergyCube [area, group, hour], built once per
+    range and shared by all sessions; pages slice their series from it (views, no masks).
+    """
+    start_dt = pd.Timestamp(start_dt).normalize()
+    end_dt = pd.Timestamp(end_dt).normalize()
+    return _load_energy_cube(elhub_backend_spec(), mode, start_dt, end_dt)
+
+
+_AGGREGATIONS = {"Daily": "D", "Monthly": "M", "Yearly": "Y"}
+
+
+@st.cache_data(ttl=7200)
+def _aggregate_energy(backend_spec, mode, start_dt, end_dt, areas, groups, granularity, by, agg, then_mean, unique_hours):
+    return elhub_backend(backend_spec).aggregate(mode, start_dt, end_dt, areas, groups, granularity, by, agg, then_mean, unique_hours)
+
+
+def aggregate_energy(mode, start_dt, end_dt, areas=None, groups=None, granularity=None,
+                     by=("pricearea", "group"), agg="sum", then_mean=False, unique_hours=False):
+    """
+    Aggregate on the backend (a MongoDB pipeline, see build_energy_pipeline) and return only the aggregated rows:
+    one column per `by` field ("group" is named productiongroup/consumptiongroup), `period` when
+    a granularity is given (and not averaged away), and `quantitykwh`.
+    """
+    areas = None if areas is None else tuple(_as_list(areas))
+    groups = None if groups is None else tuple(_as_list(groups))
+    return _aggregate_energy(elhub_backend_spec(), mode, start_dt, end_dt, areas, groups,
+                             granularity, tuple(by), agg, then_mean, unique_hours)
+
+
+# ---- Rollup query layer: answers from the pre-aggregated collections built by tools.elhub_ingest
+_GRANULARITY_RANK = {"D": 0, "M": 1, "Y": 2}
+
+
+def _day_bounds(start_dt, end_dt):
+    return pd.Timestamp(start_dt).normalize(), pd.Timestamp(end_dt).normalize()
+
+
+def _aligned_granularity(start_dt, end_dt):
+    """Coarsest rollup granularity whose whole periods exactly cover the days start_dt..end_dt."""
+    if start_dt.is_year_start and end_dt.is_year_end:
+        return "Y"
+    if start_dt.is_month_start and end_dt.is_month_end:
+        return "M"
+    return "D"
+
+
+def _rollup_rows(backend_spec, mode, start_dt, end_dt, granularity, areas=None, groups=None):
+    """Rollup rows of the days start_dt..end_dt, or None when the backend's rollups do not cover every month of the range."""
+    return elhub_backend(backend_spec).rollup_rows(mode, start_dt, end_dt, granularity, areas, groups)
+
+
+def rollup_totals(mode, start_dt, end_dt, areas=None, groups=None, by=("pricearea", "group")):
+    """
+    Total quantitykwh per `by` fields over a date range, read from the coarsest rollups that fit it
+    (yearly or monthly documents when the range is aligned, daily ones otherwise).
+    Same output as aggregate_energy without granularity, which it falls back to when the rollups do not cover the range.
+    """
+    return _rollup_totals(elhub_backend_spec(), mode, start_dt, end_dt, areas, groups, tuple(by))
+
+
+@st.cache_data(ttl=7200)
+def _rollup_totals(backend_spec, mode, start_dt, end_dt, areas, groups, by):
+    start_dt, end_dt = _day_bounds(start_dt, end_dt)
+    df = _rollup_rows(backend_spec, mode, start_dt, end_dt, _aligned_granularity(start_dt, end_dt), areas, groups)
+    if df is None:
+        return aggregate_energy(mode, start_dt, end_dt, areas=areas, groups=groups, by=by)
+
+    columns = output_columns(mode, by, None, False)[:-1]
+    if not columns:
+        return pd.DataFrame({"quantitykwh": [df["quantitykwh"].sum()]}) if not df.empty else df[["quantitykwh"]]
+    return df.groupby(columns)["quantitykwh"].sum().reset_index()
+
+
+def area_means_table(mode, start_date, end_date, aggregation):
+    """
+    Mean per-period total ("Daily", "Monthly" or "Yearly" periods) of every price area and group over a date range,
+    as one small table (area, group column, value_raw, value), computed in one pass and cached per dataset, range
+    and aggregation: switching the group on the map is a lookup in it.
+    Read from the rollups (summed from finer rollups when the range does not cover whole periods), or aggregated
+    on the backend when the rollups do not cover the range.
+    """
+    start_dt, end_dt = _day_bounds(start_date, end_date)
+    return _area_means_table(elhub_backend_spec(), mode, start_dt, end_dt, aggregation)
+
+
+@st.cache_data(ttl=7200)
+def _area_means_table(backend_spec, mode, start_dt, end_dt, aggregation):
+    if aggregation not in _AGGREGATIONS:
+        raise ValueError("Invalid aggregation value")
+    _, group_field = ELHUB_COLLECTIONS[mode]
+    target = _AGGREGATIONS[aggregation]
+    aligned = _aligned_granularity(start_dt, end_dt)
+    granularity = target if _GRANULARITY_RANK[aligned] >= _GRANULARITY_RANK[target] else aligned
+
+    df = _rollup_rows(backend_spec, mode, start_dt, end_dt, granularity)
+    if df is None:
+        df = elhub_backend(backend_spec).aggregate(mode, start_dt, end_dt, granularity=target,
+                                                   by=("pricearea", "group"), then_mean=True)
+        table = df.rename(columns={"pricearea": "area", "quantitykwh": "value_raw"})
+    else:
+        table = period_means(df["pricearea"], df[group_field], df["period"], df["quantitykwh"], target, group_field)
+    table["value"] = energy_format_kwh(table["value_raw"].to_numpy())
+    return table
 
 
 def get_group_list(df_prod, df_cons, mode):
@@ -135,58 +649,48 @@ def get_group_list(df_prod, df_cons, mode):
         return sorted(df_cons["consumptiongroup"].dropna().unique())
     
 def energy_format_kwh(x):
-    if x >= 1e6:
-        return f"{x/1e6:.2f} GWh"
-    elif x >= 1e3:
-        return f"{x/1e3:.2f} MWh"
-    else:
-        return f"{x:.0f} kWh"
-
-
-def get_area_means(df, mode, group, start_date, end_date, aggregation):
-    # 1. Filter by time window
-    df = filter_time_window(df, start_date, end_date)
-    # st.write(df.head())
-
-    # 2. Filter by production/consumption group
-    if mode == "Production":
-        df = df[df["productiongroup"] == group]
-    else:
-        df = df[df["consumptiongroup"] == group]
-
-    if df.empty:
-        return pd.DataFrame(columns=["area", "value"])
-
-    # 3. Apply aggregation: Daily / Monthly / Yearly
-    if aggregation == "Daily":
-        df["period"] = df["starttime"].dt.to_period("D")
-    elif aggregation == "Monthly":
-        df["period"] = df["starttime"].dt.to_period("M")
-    elif aggregation == "Yearly":
-        df["period"] = df["starttime"].dt.to_period("Y")
-    else:
-        raise ValueError("Invalid aggregation value")
-
-    # 4. First aggregation: sum per period per area
-    # (one value per day/month/year for each price area)
-    df_agg = (
-        df.groupby(["pricearea", "period"])["quantitykwh"]
-        .sum()
-        .reset_index()
+    """kWh as a GWh/MWh/kWh string; an array gives an array of strings (formatted in one vectorized pass)."""
+    values = np.asarray(x, dtype=np.float64)
+    gwh, mwh = values >= 1e6, values >= 1e3
+    text = np.where(
+        mwh,
+        np.char.add(np.char.mod("%.2f", np.where(gwh, values / 1e6, values / 1e3)), np.where(gwh, " GWh", " MWh")),
+        np.char.add(np.char.mod("%.0f", values), " kWh"),
     )
-
-    # 5. Second aggregation: mean across selected periods
-    df_mean = (
-        df_agg.groupby("pricearea")["quantitykwh"]
-        .mean()
-        .reset_index()
-        .rename(columns={"pricearea": "area", "quantitykwh": "value_raw"})
-    )
-
-    # 6. Add formatted string for display
-    df_mean["value"] = df_mean["value_raw"].apply(energy_format_kwh)
-
-    return df_mean
+    return str(text) if text.ndim == 0 else text.astype(object)
+
+
+# Resolution of the period key of each aggregation
+_PERIOD_UNITS = {"D": "datetime64[D]", "M": "datetime64[M]", "Y": "datetime64[Y]"}
+
+
+def period_means(areas, groups, starttime, quantity, granularity, group_field):
+    """
+    Sum per area, group and period, then the mean over the periods with data, for every area and group
+    in one pass: integer period keys and bincount instead of to_period columns and two groupbys.
+    Returns the rows (area, group_field, value_raw) of the area/group pairs with data, sorted by area and group.
+    """
+    area = pd.Categorical(areas)
+    group = pd.Categorical(groups)
+    period = np.asarray(starttime, dtype="datetime64[ns]").astype(_PERIOD_UNITS[granularity]).view(np.int64)
+    periods, period_codes = np.unique(period, return_inverse=True)
+    n_areas, n_groups, n_periods = len(area.categories), len(group.categories), len(periods)
+
+    valid = (area.codes >= 0) & (group.codes >= 0)
+    cells = ((area.codes.astype(np.int64) * n_groups + group.codes) * n_periods + period_codes)[valid]
+    size = n_areas * n_groups * n_periods
+    weights = np.nan_to_num(np.asarray(quantity, dtype=np.float64)[valid])
+    sums = np.bincount(cells, weights=weights, minlength=size).reshape(n_areas * n_groups, n_periods)
+    counts = np.bincount(cells, minlength=size).reshape(n_areas * n_groups, n_periods)
+
+    periods_with_data = (counts > 0).sum(axis=1)
+    pairs = np.flatnonzero(periods_with_data)
+    table = pd.DataFrame({
+        "area": np.asarray(area.categories, dtype=object)[pairs // n_groups],
+        group_field: np.asarray(group.categories, dtype=object)[pairs % n_groups],
+        "value_raw": sums.sum(axis=1)[pairs] / periods_with_data[pairs],
+    })
+    return table.sort_values(["area", group_field], ignore_index=True)
 
 ################################### 3.Save the basic info ###################################
 
@@ -202,62 +706,166 @@ def get_basic_info():
 
 ################################### 4.Check the data quality with STL ###################################
 
-def plot_stl_decompostion(df_production, area:str = 'NO1',group:str = 'hydro',period:int = 24,seasonal:int = 4*10+1,trend:int =24*30+1 ,robust:bool = True):
-    df_subset = df_production[(df_production['pricearea']==area) & (df_production['productiongroup']==group)]
-    df_subset.reset_index(inplace=True,drop=True)
-    stl = STL(df_subset["quantitykwh"], period=period,seasonal=seasonal,trend=trend,robust=robust)
-    res = stl.fit() # Contains the components and a plot function
-    ## Plot the results
-    fig = go.Figure()
+# STL parameters of the QC page on first load (the ones decomposed in batch)
+STL_DEFAULTS = {"period": 24, "seasonal": 41, "trend": 121, "robust": True}
+STL_CACHE_BYTES = 256 * 1024**2
+
+@st.cache_resource
+def stl_engine():
+    """Process pool + component cache shared by all sessions of the worker."""
+    return StlEngine(max_bytes=STL_CACHE_BYTES)
+
+
+def warm_stl(cube, rows=slice(None), period=24, seasonal=41, trend=121, robust=True):
+    """Queue the STL of every area/group series of an EnergyCube (within `rows`) in the process pool, without waiting."""
+    series = [
+        cube.series(area, group, rows).to_numpy()
+        for area in cube.areas for group in cube.groups if cube.has_data(area, group, rows)
+    ]
+    return stl_engine().submit_many(series, period, seasonal, trend, robust)
+
+
+def stl_decompose(series, period=24, seasonal=41, trend=121, robust=True):
+    """Trend/seasonal/resid arrays of one series, from the engine's cache when already decomposed."""
+    return stl_engine().components(series.to_numpy(), period, seasonal, trend, robust)
+
+
+def stl_figure(series, components, area, group):
+    """Plotly figure of an STL decomposition (no fitting)."""
     fig = make_subplots(rows=4, cols=1, shared_xaxes=True,subplot_titles=["Observed", "Trend", "Seasonal", "Residual"],vertical_spacing=0.05)
     # original data
-    fig.add_trace(go.Scatter(x=df_subset['starttime'],y=df_subset["quantitykwh"],mode='lines',name='Observed',line=dict(color='blue')),row=1, col=1)
+    fig.add_trace(go.Scatter(x=series.index,y=series.to_numpy(),mode='lines',name='Observed',line=dict(color='blue')),row=1, col=1)
     # Trend
-    fig.add_trace(go.Scatter(x=df_subset['starttime'],y=res.trend,mode='lines',name='Trend',line=dict(color='orange')),row=2, col=1)
+    fig.add_trace(go.Scatter(x=series.index,y=components["trend"],mode='lines',name='Trend',line=dict(color='orange')),row=2, col=1)
     # Seasonal
-    fig.add_trace(go.Scatter(x=df_subset['starttime'],y=res.seasonal,mode='lines',name='Seasonal',line=dict(color='green')),row=3, col=1)
+    fig.add_trace(go.Scatter(x=series.index,y=components["seasonal"],mode='lines',name='Seasonal',line=dict(color='green')),row=3, col=1)
     # Residual
-    fig.add_trace(go.Scatter(x=df_subset['starttime'],y=res.resid,mode='lines',name='Residual',line=dict(color='gray', dash='dot')),row=4, col=1)
+    fig.add_trace(go.Scatter(x=series.index,y=components["resid"],mode='lines',name='Residual',line=dict(color='gray', dash='dot')),row=4, col=1)
     fig.update_layout(title=f'The STL decomposition of area:{area} and productiongroup:{group}', xaxis4_title='Time (hourly)', yaxis_title='Values',height=900)
-
     return fig
 
 ################################### 5.Check the data quality with SPC ###################################
 
+# Stages of the DCT-SPC detector (tools/spc.py), cached by series content:
+# the spectrum per series, the trend/SD per cutoff; the threshold k is applied uncached
+@st.cache_data(max_entries=64)
+def _spc_spectrum(values):
+    return dct_spectrum(values)
+
+
+@st.cache_data(max_entries=256)
+def _spc_bands(values, W_filter):
+    return spc_bands(_spc_spectrum(values), W_filter)
+
+
+# Sensitivity curve grid: k values, and cutoffs of 30-day, 10-day, 3-day, 1-day and 12-hour periods
+SPC_SWEEP_KS = np.round(np.arange(1.0, 5.0001, 0.1), 2)
+SPC_SWEEP_CUTOFFS = (1/(30*24), 1/(10*24), 1/(3*24), 1/24, 1/12)
+
+@st.cache_data(max_entries=64)
+def spc_sensitivity(values, W_filter=None, coef_ks=SPC_SWEEP_KS, cutoffs=SPC_SWEEP_CUTOFFS):
+    """Outlier counts over a grid of k values and cutoffs (plus W_filter), as a tidy frame (W_filter, k, num_outliers, ratio_outlier)."""
+    cutoffs = sorted(set(cutoffs) | ({W_filter} if W_filter is not None else set()))
+    counts = spc_sweep(_spc_spectrum(values), coef_ks, cutoffs)
+    table = pd.DataFrame({
+        "W_filter": np.repeat(cutoffs, len(coef_ks)),
+        "k": np.tile(coef_ks, len(cutoffs)),
+        "num_outliers": counts.reshape(-1),
+    })
+    table["ratio_outlier"] = (table["num_outliers"] / len(values) * 100).round(2)
+    return table
+
+
+def plot_spc_sensitivity(table, W_filter, coef_k):
+    """Outlier rate vs k, one line per cutoff; the current (cutoff, k) is marked."""
+    fig = go.Figure()
+    for cutoff, rows in table.groupby("W_filter"):
+        current = np.isclose(cutoff, W_filter)
+        fig.add_trace(go.Scatter(
+            x=rows["k"], y=rows["ratio_outlier"], mode="lines",
+            name=f"W_cutoff {cutoff:.5f} (~{1/cutoff:.0f} h)",
+            line=dict(width=3 if current else 1.5, dash=None if current else "dot"),
+        ))
+    point = table[np.isclose(table["W_filter"], W_filter) & np.isclose(table["k"], coef_k)]
+    if not point.empty:
+        fig.add_trace(go.Scatter(
+            x=point["k"], y=point["ratio_outlier"], mode="markers",
+            marker=dict(color="orange", size=12), name="Current selection",
+        ))
+    fig.update_layout(
+        title="SPC sensitivity: outlier rate vs sigma multiplier",
+        xaxis_title="Sigma Multiplier (k)", yaxis_title="Outlier Rate (%)", height=350,
+    )
+    return fig
+
+
+@st.cache_data(ttl=3600, max_entries=16)
+def _spc_fleet(provider_spec, years, variables, W_filter, coef_k):
+    # Series of the representative city of every price area, stacked by length (leap years differ)
+    locations = get_basic_info().drop_duplicates("price_area_code")
+    stacks = {}
+    for row in locations.itertuples():
+        frame = load_weather_frame(row.longitude, row.latitude, f"{years[0]}-01-01", f"{years[-1]}-12-31", variables)
+        for year in years:
+            if year not in frame.year_offsets:
+                continue
+            rows = frame.year_slice(year)
+            for variable in variables:
+                stack = stacks.setdefault(rows.stop - rows.start, {"keys": [], "values": [], "hours": []})
+                stack["keys"].append((row.price_area_code, row.city, variable, year))
+                stack["values"].append(frame.column(variable, rows))
+                stack["hours"].append(frame.hours[rows])
+
+    summaries, tables = [], []
+    for n, stack in stacks.items():
+        outliers, signal, trend, sd = spc_batch(np.stack(stack["values"]), W_filter, coef_k)
+        keys = pd.DataFrame(stack["keys"], columns=["price_area", "city", "variable", "year"])
+        summary = keys.assign(num_sample=n, num_outliers=outliers.sum(axis=1), sd=sd)
+        summary["ratio_outlier"] = (summary["num_outliers"] / n * 100).round(2)
+        summaries.append(summary)
+
+        series, hour = np.nonzero(outliers)
+        table = keys.iloc[series].reset_index(drop=True)
+        table["date"] = pd.to_datetime(np.stack(stack["hours"])[series, hour], unit="h", utc=True).tz_convert("Europe/Oslo")
+        table["value"] = signal[series, hour]
+        table["trend"] = trend[series, hour]
+        table["sd"] = sd[series]
+        tables.append(table)
+
+    if not summaries:
+        return (pd.DataFrame(columns=["price_area", "city", "variable", "year", "num_sample", "num_outliers", "sd", "ratio_outlier"]),
+                pd.DataFrame(columns=["price_area", "city", "variable", "year", "date", "value", "trend", "sd"]))
+    summary = pd.concat(summaries, ignore_index=True).sort_values(["price_area", "variable", "year"], ignore_index=True)
+    outliers = pd.concat(tables, ignore_index=True).sort_values(["price_area", "variable", "date"], ignore_index=True)
+    return summary, outliers
+
+
+def spc_fleet(years, variables=None, W_filter=1/(10*24), coef_k=3.0):
+    """
+    DCT-SPC of every price-area city, weather variable and year in one batched pass (spc_batch).
+    Returns (summary, outliers): one summary row per city/variable/year and one row per outlier hour.
+    """
+    years = tuple(range(min(years), max(years) + 1))
+    variables = tuple(dict.fromkeys(variables or WEATHER_VARIABLES))
+    # One batched fetch of whatever the store is missing, then only local reads
+    warm_price_area_weather(years[0], years[-1], variables)
+    return _spc_fleet(get_weather_provider().spec, years, variables, float(W_filter), float(coef_k))
+
+
 def plot_outlier_detection_dct(hourly_dataframe,selected_variable: str, W_filter: float = 1/(10*24), coef_k: float = 3):
-    signal = hourly_dataframe[selected_variable].to_numpy(float)
-    N = hourly_dataframe.shape[0]
-    dt = 1
-    W = np.linspace(0, 1/(2*dt), N) # cycles/hour
-
-    # check and fill NaN values with mean
-    if np.isnan(signal).any():
-        signal = np.nan_to_num(signal, nan=np.nanmean(signal))
-
-    # Discrete Cosine transform
-    fourier_signal = dct(signal, norm="ortho")
-
-    # high-pass filter to keep the high-frequency components
-    filtered_hp_signal = fourier_signal.copy()
-    filtered_hp_signal[(W < W_filter)] = 0 
-    satv = idct(filtered_hp_signal, norm="ortho") 
-
-    # low-pass filter to keep the trend
-    filtered_lp_signal = fourier_signal.copy()
-    filtered_lp_signal[(W > W_filter)] = 0 
-    trend = idct(filtered_lp_signal, norm="ortho") 
-
-    # Median absolute deviation
-    coef_k = coef_k
-    mad_raw = stats.median_abs_deviation(satv, scale=1.0)
-    sd = mad_raw * 1.4826
-    print(sd)
+    # Spectrum and bands come from the cache: only the threshold is recomputed when k changes
+    bands = _spc_bands(hourly_dataframe[selected_variable].to_numpy(float), W_filter)
+    signal = bands.signal
+    N = len(signal)
+    trend = bands.trend
+    sd = bands.sd
+
     # Find the boundaries
     upper_boundary = trend + coef_k * sd
     lower_boundary = trend - coef_k * sd
 
     # Detect the outliers
-    outlier_mask = (signal > upper_boundary) | (signal < lower_boundary)
+    outlier_mask = spc_outliers(bands, coef_k)
 
     fig = go.Figure()
 
@@ -315,15 +923,32 @@ def plot_outlier_detection_dct(hourly_dataframe,selected_variable: str, W_filter
 
 ################################### 6.Check the data quality with LOF ###################################
 
+# Stages of the 1-D LOF (tools/lof.py): the neighbour graph is built once per series for the
+# largest k of the page slider and shared; scores per k are cached, the contamination is uncached
+LOF_MAX_NEIGHBORS = 100
+
+@st.cache_resource(max_entries=16)
+def _lof_graph(values, max_k):
+    return neighbour_graph(values, max_k)
+
+
+@st.cache_data(max_entries=64)
+def _lof_scores(values, n_neighbors):
+    graph = _lof_graph(values, max(n_neighbors, LOF_MAX_NEIGHBORS))
+    return lof_scores(graph, n_neighbors)
+
+
 def plot_outlier_detection_lof(hourly_dataframe,selected_variable: str, contamination: float = 0.01, n_neighbors: int = 50):
     selected_data = hourly_dataframe[[selected_variable]].copy()
 
-    lof = LocalOutlierFactor(n_neighbors=n_neighbors, contamination=contamination)
-    pred_labels = lof.fit_predict(selected_data)
+    # Sorted-window LOF: LocalOutlierFactor's score and threshold definitions; with tied values
+    # (frequent in hourly weather) other neighbours are chosen, so the flagged hours can differ
+    values = selected_data[selected_variable].to_numpy(float)
+    graph = _lof_graph(values, max(n_neighbors, LOF_MAX_NEIGHBORS))
+    outlier_mask = lof_outliers(graph.positions, _lof_scores(values, n_neighbors), contamination, len(values))
 
     # Separate normal and outliers
-    outlier_mask = pred_labels == -1
-    normal_mask = pred_labels == 1
+    normal_mask = ~outlier_mask
 
 
     fig = go.Figure()
@@ -344,17 +969,121 @@ def plot_outlier_detection_lof(hourly_dataframe,selected_variable: str, contamin
 
     return fig, summary
 
+# Joint (multivariate) LOF over standardised variables and a range of years, per location.
+# Graphs live in a byte-bounded cache: built for the largest k of the slider when that fits in
+# 1/8 of the budget (short ranges), else for the chosen k. The approximate mode searches a random
+# subsample of n * JOINT_LOF_APPROX_NEIGHBORS / k hours for JOINT_LOF_APPROX_NEIGHBORS neighbours,
+# which covers about the same neighbourhood as k neighbours among all hours at a fraction of the cost.
+LOF_CACHE_BYTES = 256 * 1024**2
+JOINT_LOF_APPROX_NEIGHBORS = 10
+
+@st.cache_resource
+def _lof_graph_cache():
+    return ChunkCache(max_bytes=LOF_CACHE_BYTES)
+
+
+def _joint_lof_graph(frame, request, variables, n_neighbors, approximate):
+    n_rows = len(frame)
+    max_k, reference_size = n_neighbors, None
+    if approximate and n_neighbors > JOINT_LOF_APPROX_NEIGHBORS:
+        max_k = JOINT_LOF_APPROX_NEIGHBORS
+        reference_size = -(-n_rows * max_k // n_neighbors)
+    elif n_rows * LOF_MAX_NEIGHBORS * 16 <= LOF_CACHE_BYTES // 8:   # an index and a distance per neighbour
+        max_k = max(n_neighbors, LOF_MAX_NEIGHBORS)
+
+    cache = _lof_graph_cache()
+    # The current year's frame grows, so its length is part of the key
+    key = (request, n_rows, max_k, reference_size)
+    graph = cache.get(key)
+    if graph is None:
+        matrix = standardize(np.column_stack([frame.column(v) for v in variables]))
+        graph = joint_neighbour_graph(matrix, max_k, workers=-1, reference_size=reference_size)
+        cache.put(key, graph)
+    return graph
+
+
+@st.cache_data(ttl=3600, max_entries=32)
+def _joint_lof_scores(provider_spec, longitude, latitude, start_date, end_date, variables, n_neighbors, approximate):
+    frame = load_weather_frame(longitude, latitude, start_date, end_date, variables)
+    request = (provider_spec, longitude, latitude, start_date, end_date, variables)
+    graph = _joint_lof_graph(frame, request, variables, n_neighbors, approximate)
+    return graph.positions, lof_scores(graph, n_neighbors)
+
+
+def joint_lof(longitude, latitude, start_year, end_year, variables, contamination=0.01, n_neighbors=50, approximate=False):
+    """
+    Multivariate LOF of a location over whole years: one row per hour with the variables, their
+    z-scores, the LOF score and the outlier flag (hours missing a variable are not scored).
+    Scores are cached per (location, variables, years, k); only the threshold depends on contamination.
+    """
+    latitude, longitude = get_weather_cell(latitude, longitude)
+    start_date, end_date, variables = _normalize_request(f"{start_year}-01-01", f"{end_year}-12-31", variables)
+    spec = get_weather_provider().spec
+    positions, scores = _joint_lof_scores(spec, longitude, latitude, start_date, end_date, variables, n_neighbors, approximate)
+
+    table = load_weather_frame(longitude, latitude, start_date, end_date, variables).to_frame(list(variables))
+    zscores = standardize(table[list(variables)].to_numpy())
+    for i, variable in enumerate(variables):
+        table[f"z_{variable}"] = zscores[:, i]
+    table["lof_score"] = np.nan
+    table.loc[positions, "lof_score"] = scores
+    table["outlier"] = lof_outliers(positions, scores, contamination, len(table))
+    return table
+
+
+def plot_joint_lof(table, variables):
+    """LOF score over time (outliers marked) and the first two variables against each other."""
+    outliers = table[table["outlier"]]
+    fig = make_subplots(rows=1, cols=2, column_widths=[0.6, 0.4],
+                        subplot_titles=("LOF score over time", f"{variables[0]} vs {variables[-1]}"))
+    fig.add_trace(go.Scattergl(x=table["date"], y=table["lof_score"], mode="lines",
+                               line=dict(color="blue", width=1), name="LOF score"), row=1, col=1)
+    fig.add_trace(go.Scattergl(x=outliers["date"], y=outliers["lof_score"], mode="markers",
+                               marker=dict(color="orange", size=6), name="outlier"), row=1, col=1)
+    normal = table[~table["outlier"]]
+    fig.add_trace(go.Scattergl(x=normal[variables[0]], y=normal[variables[-1]], mode="markers",
+                               marker=dict(color="blue", size=3, opacity=0.4), name="normal"), row=1, col=2)
+    fig.add_trace(go.Scattergl(x=outliers[variables[0]], y=outliers[variables[-1]], mode="markers",
+                               marker=dict(color="orange", size=6), showlegend=False), row=1, col=2)
+    fig.update_xaxes(title_text="Time (hourly)", row=1, col=1)
+    fig.update_xaxes(title_text=variables[0], row=1, col=2)
+    fig.update_yaxes(title_text="LOF score", row=1, col=1)
+    fig.update_yaxes(title_text=variables[-1], row=1, col=2)
+    fig.update_layout(title=f"Joint LOF anomalies of {', '.join(variables)}", height=450)
+    return fig
+
 ################################### 6.Plot the spectrogram ###################################
-def plot_spectrogram(df_production,area: str = "NO1",group: str = "hydro",nperseg: int = 40,noverlap: int = 20):
-    df_subset = df_production[(df_production["pricearea"] == area)& (df_production["productiongroup"] == group)].sort_values("starttime")
-    y = df_subset["quantitykwh"].values
-    fs = 1
-    f, t, Zxx = stft(y, fs=fs, nperseg=nperseg, noverlap=noverlap)
+# Shown frequency band (cycles/hour) and the most time frames sent to the browser
+SPECTROGRAM_MAX_FREQ = 0.05
+SPECTROGRAM_MAX_FRAMES = 1000
+
+@st.cache_data(max_entries=64)
+def _stft_magnitude(values, nperseg, noverlap, max_freq):
+    """|STFT| of a series, cropped to frequencies <= max_freq (one row beyond it, so the band edge is drawn)."""
+    f, t, Zxx = stft(values, fs=1, nperseg=nperseg, noverlap=noverlap)
+    rows = min(int(np.searchsorted(f, max_freq, "right")) + 1, len(f))
+    return f[:rows], t, np.abs(Zxx[:rows]).astype(np.float32)
+
+
+def _decimate_frames(t, magnitude, max_frames):
+    """At most max_frames time frames: blocks of neighbouring frames are merged by their maximum (peaks stay visible)."""
+    factor = -(-len(t) // max_frames)
+    if factor <= 1:
+        return t, magnitude
+    n_blocks = -(-len(t) // factor)
+    padded = np.pad(magnitude, ((0, 0), (0, n_blocks * factor - len(t))), constant_values=np.nan)
+    return t[::factor], np.nanmax(padded.reshape(len(magnitude), n_blocks, factor), axis=2)
+
+
+def plot_spectrogram(series,area: str = "NO1",group: str = "hydro",nperseg: int = 40,noverlap: int = 20,
+                     max_freq: float = SPECTROGRAM_MAX_FREQ, max_frames: int = SPECTROGRAM_MAX_FRAMES):
+    """Spectrogram of one area/group series (quantitykwh indexed by starttime, e.g. EnergyCube.series)."""
+    # Cached per series and window; only the shown band and at most max_frames frames are sent
+    f, t, magnitude = _stft_magnitude(series.to_numpy(float), nperseg, noverlap, max_freq)
+    t, magnitude = _decimate_frames(t, magnitude, max_frames)
 
     fig = go.Figure()
-    magnitude = np.abs(Zxx)
-    start_time = df_subset["starttime"].iloc[0]
-    t_datetime = [start_time + pd.Timedelta(hours=float(h)) for h in t]
+    t_datetime = series.index[0] + pd.to_timedelta(t, unit="h")
 
     fig.add_trace(go.Heatmap(
         x=t_datetime,
@@ -363,7 +1092,7 @@ def plot_spectrogram(df_production,area: str = "NO1",group: str = "hydro",nperse
         colorscale="Viridis",
         colorbar=dict(title="Amplitude"),
         zmin=0,
-        zmax=magnitude.max() * 0.8,
+        zmax=float(magnitude.max()) * 0.8 if magnitude.size else None,
         hovertemplate="Date: %{x|%Y-%m-%d %H:%M}<br>Freq: %{y:.4f}/h<br>Amp: %{z:.2f}<extra></extra>"
     ))
 
@@ -374,7 +1103,7 @@ def plot_spectrogram(df_production,area: str = "NO1",group: str = "hydro",nperse
         template="plotly_white",
         height=600,
     )
-    fig.update_yaxes(range=[0, 0.05])
+    fig.update_yaxes(range=[0, max_freq])
     return fig
 
 
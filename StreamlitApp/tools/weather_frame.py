@@ -0,0 +1,138 @@
+"""
+Compact in-memory representation of hourly weather.
+
+A WeatherFrame holds
+ - `hours`: int64 hours since 1970-01-01 UTC (one per row, sorted)
+ - one contiguous, read-only float32 array per variable
+ - precomputed row offsets of every local (Europe/Oslo) month and year
+
+so pages can take a month, a range of months or a single variable as array views,
+without `dt.strftime` label columns, boolean masks or full-frame copies.
+"""
+
+import numpy as np
+import pandas as pd
+
+LOCAL_TZ = "Europe/Oslo"
+_NS_PER_HOUR = 3_600_000_000_000
+
+
+def period_offsets(local_dates):
+    """Row offsets of every month ("YYYY-MM") and year of sorted local dates, from one pass over the index."""
+    month_key = local_dates.year.to_numpy() * 12 + local_dates.month.to_numpy() - 1
+    starts = np.flatnonzero(np.diff(month_key)) + 1 if len(month_key) else np.array([], dtype=int)
+    starts = np.concatenate([[0], starts]) if len(month_key) else starts
+    stops = np.append(starts[1:], len(month_key))
+
+    month_offsets = {}
+    year_offsets = {}
+    for start, stop in zip(starts, stops):
+        year, month = divmod(int(month_key[start]), 12)
+        month_offsets[f"{year}-{month + 1:02d}"] = (int(start), int(stop))
+        first, _ = year_offsets.get(year, (int(start), None))
+        year_offsets[year] = (first, int(stop))
+    return month_offsets, year_offsets
+
+
+class WeatherFrame:
+
+    def __init__(self, hours, values, tz=LOCAL_TZ, grid_cell=None):
+        self.hours = np.ascontiguousarray(hours, dtype=np.int64)
+        self.values = {}
+        for variable, array in values.items():
+            array = np.ascontiguousarray(array, dtype=np.float32)
+            array.flags.writeable = False
+            self.values[variable] = array
+        self.hours.flags.writeable = False
+        self.tz = tz
+        self.grid_cell = grid_cell
+        self._build_offsets()
+
+    @classmethod
+    def from_dataframe(cls, df, tz=LOCAL_TZ):
+        """Build from a loader frame (tz-aware `date` column + one column per variable)."""
+        dates = pd.DatetimeIndex(df["date"])
+        if dates.tz is None:
+            dates = dates.tz_localize(tz)
+        hours = (dates.tz_convert("UTC").tz_localize(None) - pd.Timestamp(0)) // pd.Timedelta(hours=1)
+        values = {c: df[c].to_numpy(dtype=np.float32) for c in df.columns if c != "date"}
+        return cls(np.asarray(hours), values, tz=tz, grid_cell=df.attrs.get("grid_cell"))
+
+    def _build_offsets(self):
+        """Row offsets of every local month ("YYYY-MM") and year."""
+        self.month_offsets, self.year_offsets = period_offsets(self.dates)
+
+    # ---------------------------------------------------------------- basic info
+    def __len__(self):
+        return len(self.hours)
+
+    @property
+    def variables(self):
+        return list(self.values)
+
+    @property
+    def months(self):
+        """Local month labels ("YYYY-MM") in time order."""
+        return list(self.month_offsets)
+
+    @property
+    def nbytes(self):
+        return self.hours.nbytes + sum(a.nbytes for a in self.values.values())
+
+    @property
+    def dates(self):
+        """Local timestamps of the rows (built on demand from the hour index)."""
+        return pd.DatetimeIndex(self.hours * _NS_PER_HOUR, tz="UTC").tz_convert(self.tz)
+
+    # ---------------------------------------------------------------- slicing
+    def column(self, variable, rows=slice(None)):
+        """Read-only float32 view of one variable."""
+        return self.values[variable][rows]
+
+    def month_slice(self, start_month, end_month=None):
+        """Row slice covering the local months start_month..end_month ("YYYY-MM" labels, inclusive)."""
+        end_month = end_month or start_month
+        start = self.month_offsets[start_month][0]
+        stop = self.month_offsets[end_month][1]
+        return slice(start, stop)
+
+    def year_slice(self, year):
+        start, stop = self.year_offsets[int(year)]
+        return slice(start, stop)
+
+    def time_slice(self, start, end):
+        """Row slice of the timestamps start <= t <= end (binary search on the hour index)."""
+        start_hour = (pd.Timestamp(start).tz_convert("UTC").tz_localize(None) - pd.Timestamp(0)) // pd.Timedelta(hours=1)
+        end_hour = (pd.Timestamp(end).tz_convert("UTC").tz_localize(None) - pd.Timestamp(0)) // pd.Timedelta(hours=1)
+        return slice(int(np.searchsorted(self.hours, start_hour, "left")), int(np.searchsorted(self.hours, end_hour, "right")))
+
+    def take(self, rows=slice(None), variables=None):
+        """A WeatherFrame over a row slice and/or a subset of variables (arrays are views, nothing is copied)."""
+        variables = variables or self.variables
+        sub = WeatherFrame.__new__(WeatherFrame)
+        sub.hours = self.hours[rows]
+        sub.values = {v: self.values[v][rows] for v in variables}
+        sub.tz = self.tz
+        sub.grid_cell = self.grid_cell
+        sub._build_offsets()
+        return sub
+
+    # ---------------------------------------------------------------- pandas output for plotting
+    def to_frame(self, variables=None, rows=slice(None)):
+        """Wide pandas frame (`date` + variables) of the selected rows, for plotting."""
+        variables = variables or self.variables
+        data = {"date": self.dates[rows]}
+        for variable in variables:
+            data[variable] = self.values[variable][rows]
+        return pd.DataFrame(data)
+
+    def to_long(self, variables=None, rows=slice(None)):
+        """Long frame (date, variable, value) of the selected rows, built directly from the arrays instead of `melt`."""
+        variables = variables or self.variables
+        hours = self.hours[rows]
+        dates = pd.DatetimeIndex(np.tile(hours, len(variables)) * _NS_PER_HOUR, tz="UTC").tz_convert(self.tz)
+        return pd.DataFrame({
+            "date": dates,
+            "variable": np.repeat(variables, len(hours)),
+            "value": np.concatenate([self.values[v][rows] for v in variables]) if variables else np.array([], dtype=np.float32),
+        })
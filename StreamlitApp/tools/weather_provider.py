@@ -0,0 +1,347 @@
+"""
+Pluggable sources of hourly weather behind `tools.utils.load_weather_range`.
+
+Every provider returns a DataFrame with a tz-aware `date` column and one float32 column per
+requested variable, covering the local (Europe/Oslo) days start_date..end_date.
+
+Available providers (selected with the WEATHER_PROVIDER environment variable):
+ - "openmeteo"  : the Open-Meteo archive API (ERA5), default
+ - "csv"        : data/open-meteo-subset.csv replayed for any year, no network
+ - "synthetic"  : deterministic seasonal/diurnal signal + seeded noise, no network
+ - "http://..." : any server speaking the archive API in JSON, e.g. tools/openmeteo_standin.py
+"""
+
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+import openmeteo_requests
+from retry_requests import retry
+
+# Hourly variables requested by default (the order matters when decoding the response)
+WEATHER_VARIABLES = ["temperature_2m", "wind_speed_10m", "wind_gusts_10m", "wind_direction_10m", "precipitation"]
+
+# ERA5 grid spacing in degrees; the archive API serves the nearest grid point of a requested location
+ERA5_RESOLUTION = 0.25
+
+ARCHIVE_URL = "https://archive-api.open-meteo.com/v1/archive"
+SUBSET_CSV = Path(__file__).resolve().parent.parent / "data" / "open-meteo-subset.csv"
+LOCAL_TZ = "Europe/Oslo"
+
+
+def snap_to_grid(latitude, longitude, resolution=ERA5_RESOLUTION):
+    """
+    Return the (latitude, longitude) of the ERA5 grid point whose cell contains the given point.
+    Every click inside the same 0.25° cell maps to the same cell, so they share one cached series.
+    """
+    def snap(value):
+        return round(math.floor(float(value) / resolution + 0.5) * resolution, 4)
+    return snap(latitude), snap(longitude)
+
+
+def local_hours(start_date, end_date):
+    """Hourly UTC timestamps covering the local days start_date..end_date (inclusive)."""
+    start = pd.Timestamp(start_date).tz_localize(LOCAL_TZ)
+    end = (pd.Timestamp(end_date) + pd.Timedelta(days=1)).tz_localize(LOCAL_TZ)
+    return pd.date_range(start, end, freq="h", inclusive="left").tz_convert("UTC")
+
+
+def _splitmix64(x):
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _hash_normal(key, hours):
+    """Standard normal noise that depends only on (key, hour), so any sub-range request returns the same values."""
+    x = (hours.astype("uint64") << np.uint64(1)) ^ (np.uint64(key) << np.uint64(40))
+    u1 = 1.0 - (_splitmix64(x) >> np.uint64(11)) * 2.0 ** -53
+    u2 = (_splitmix64(x | np.uint64(1)) >> np.uint64(11)) * 2.0 ** -53
+    return np.sqrt(-2.0 * np.log(u1)) * np.cos(2 * np.pi * u2)
+
+
+class WeatherProvider:
+    """Base class: subclasses implement `fetch`, and `fetch_many` when one request can carry several locations."""
+
+    name = "base"
+    # Most locations packed into a single request
+    max_locations_per_call = 1
+
+    def fetch(self, latitude, longitude, start_date, end_date, variables=None):
+        raise NotImplementedError
+
+    def fetch_many(self, points, start_date, end_date, variables=None):
+        """One frame per (latitude, longitude) point, in the same order."""
+        return [self.fetch(lat, lon, start_date, end_date, variables) for lat, lon in points]
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """The Open-Meteo archive API, decoded from its flatbuffer responses."""
+
+    name = "openmeteo"
+    max_locations_per_call = 50
+
+    def __init__(self, url=ARCHIVE_URL):
+        self.url = url
+        # Setup the Open-Meteo API client with retry on error (decoded data is persisted in weather_store)
+        retry_session = retry(retries = 5, backoff_factor = 0.2)
+        self.client = openmeteo_requests.Client(session = retry_session)
+
+    def fetch(self, latitude, longitude, start_date, end_date, variables=None):
+        return self.fetch_many([(latitude, longitude)], start_date, end_date, variables)[0]
+
+    def fetch_many(self, points, start_date, end_date, variables=None):
+        variables = list(variables or WEATHER_VARIABLES)
+        params = {
+            "latitude": [lat for lat, _ in points],
+            "longitude": [lon for _, lon in points],
+            "start_date": start_date,
+            "end_date": end_date,
+            "hourly": variables,
+            "models": "era5",
+            "timezone": "auto",
+            "wind_speed_unit": "ms",
+        }
+        responses = self.client.weather_api(self.url, params=params)
+        print(f"Date_range: {params['start_date']} - {params['end_date']}")
+        print(f"Variables: {params['hourly']}")
+
+        # One response per location, in the requested order
+        frames = []
+        for response in responses:
+            print(f"Coordinates: {response.Latitude()}°N {response.Longitude()}°E")
+
+            # Process hourly data. The order of variables needs to be the same as requested.
+            hourly = response.Hourly()
+            hourly_data = {"date": pd.date_range(
+                start = pd.to_datetime(hourly.Time(), unit = "s", utc = True),
+                end =  pd.to_datetime(hourly.TimeEnd(), unit = "s", utc = True),
+                freq = pd.Timedelta(seconds = hourly.Interval()),
+                inclusive = "left"
+            )}
+            for i, variable in enumerate(variables):
+                hourly_data[variable] = hourly.Variables(i).ValuesAsNumpy()
+            frames.append(pd.DataFrame(data = hourly_data))
+        return frames
+
+
+class ArchiveJsonProvider(WeatherProvider):
+    """Any server speaking the archive API in JSON (the real API or the local stand-in)."""
+
+    max_locations_per_call = 50
+
+    def __init__(self, base_url):
+        self.url = base_url.rstrip("/")
+        if not self.url.endswith("/v1/archive"):
+            self.url += "/v1/archive"
+        # One store folder per server, e.g. "archive-127.0.0.1-8000": a stand-in replaying offline
+        # data never shares partitions with a real archive endpoint
+        url = urlparse(self.url)
+        server = url.netloc + url.path[:-len("/v1/archive")]
+        self.name = "archive-" + re.sub(r"[^A-Za-z0-9.]+", "-", server).strip("-")
+        self.session = retry(retries = 5, backoff_factor = 0.2)
+
+    def fetch(self, latitude, longitude, start_date, end_date, variables=None):
+        return self.fetch_many([(latitude, longitude)], start_date, end_date, variables)[0]
+
+    def fetch_many(self, points, start_date, end_date, variables=None):
+        variables = list(variables or WEATHER_VARIABLES)
+        params = {
+            "latitude": ",".join(str(lat) for lat, _ in points),
+            "longitude": ",".join(str(lon) for _, lon in points),
+            "start_date": start_date,
+            "end_date": end_date,
+            "hourly": ",".join(variables),
+            "models": "era5",
+            "timezone": "auto",
+            "timeformat": "unixtime",
+            "wind_speed_unit": "ms",
+            "format": "json",
+        }
+        response = self.session.get(self.url, params=params, timeout=60)
+        response.raise_for_status()
+        payload = response.json()
+        # A single location comes back as an object, several as a list
+        if isinstance(payload, dict):
+            payload = [payload]
+
+        frames = []
+        for location in payload:
+            hourly = location["hourly"]
+            hourly_data = {"date": pd.to_datetime(np.asarray(hourly["time"], dtype="int64"), unit="s", utc=True)}
+            for variable in variables:
+                hourly_data[variable] = np.asarray(hourly[variable], dtype="float32")
+            frames.append(pd.DataFrame(data = hourly_data))
+        return frames
+
+
+class CsvProvider(WeatherProvider):
+    """
+    Replays data/open-meteo-subset.csv (8760 hourly rows) for any location and year.
+    Hour h of a year maps to row h % 8760, so every request is deterministic and network-free.
+    """
+
+    name = "csv"
+
+    def __init__(self, path=SUBSET_CSV):
+        df = pd.read_csv(path)
+        # "temperature_2m (°C)" -> "temperature_2m"
+        df.columns = [c.split(" ")[0] for c in df.columns]
+        self.table = {c: df[c].to_numpy(dtype="float32") for c in df.columns if c != "time"}
+        self.n_rows = len(df)
+
+    def fetch(self, latitude, longitude, start_date, end_date, variables=None):
+        variables = list(variables or WEATHER_VARIABLES)
+        unknown = [v for v in variables if v not in self.table]
+        if unknown:
+            raise ValueError(f"Variables not available in {SUBSET_CSV.name}: {unknown}")
+
+        dates = local_hours(start_date, end_date)
+        year_start = pd.to_datetime(dates.year.astype(str), utc=True)
+        rows = ((dates - year_start) // pd.Timedelta(hours=1)).to_numpy() % self.n_rows
+
+        hourly_data = {"date": dates}
+        for variable in variables:
+            hourly_data[variable] = self.table[variable][rows]
+        return pd.DataFrame(data = hourly_data)
+
+
+class SyntheticProvider(WeatherProvider):
+    """Seasonal + diurnal cycle with seeded noise; the seed depends on location and variable only."""
+
+    name = "synthetic"
+
+    # variable: (mean, seasonal amplitude, diurnal amplitude, noise sd, lower bound, upper bound)
+    PROFILES = {
+        "temperature_2m": (5.0, -10.0, 3.0, 2.0, -50.0, 50.0),
+        "wind_speed_10m": (4.0, 1.0, 0.8, 2.0, 0.0, 60.0),
+        "wind_gusts_10m": (9.0, 2.0, 1.5, 4.0, 0.0, 90.0),
+        "wind_direction_10m": (200.0, 0.0, 0.0, 90.0, 0.0, 360.0),
+        "precipitation": (-0.5, 0.2, 0.0, 1.0, 0.0, 50.0),
+    }
+    DEFAULT_PROFILE = (0.0, 1.0, 0.5, 1.0, -np.inf, np.inf)
+
+    def __init__(self, seed=320):
+        self.seed = seed
+
+    def fetch(self, latitude, longitude, start_date, end_date, variables=None):
+        variables = list(variables or WEATHER_VARIABLES)
+        dates = local_hours(start_date, end_date)
+        hours = ((dates - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(hours=1)).to_numpy()
+        season = np.cos(2 * np.pi * (dates.dayofyear.to_numpy() - 15) / 365.25)
+        diurnal = np.sin(2 * np.pi * (dates.hour.to_numpy() - 9) / 24)
+
+        hourly_data = {"date": dates}
+        for variable in variables:
+            mean, amp_season, amp_day, noise, low, high = self.PROFILES.get(variable, self.DEFAULT_PROFILE)
+            key = zlib.crc32(f"{self.seed}:{float(latitude):.2f}:{float(longitude):.2f}:{variable}".encode())
+            values = mean + amp_season * season + amp_day * diurnal + noise * _hash_normal(key, hours)
+            if variable == "wind_direction_10m":
+                values = values % 360
+            hourly_data[variable] = np.clip(values, low, high).astype("float32")
+        return pd.DataFrame(data = hourly_data)
+
+
+################################### Batched requests with a rate limit ###################################
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter shared by all requests of a process.
+    `rate` tokens are added per second up to `capacity`; acquire(n) blocks until n tokens are available.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        tokens = min(tokens, self.capacity)
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                time.sleep((tokens - self.tokens) / self.rate)
+
+
+# Open-Meteo free tier: 600 weighted calls per minute
+_LIMITER = TokenBucket(rate=600 / 60, capacity=600)
+
+
+def request_weight(n_locations, start_date, end_date, n_variables):
+    """
+    Weighted API calls of one request, as counted by Open-Meteo: every location counts separately,
+    and so does every started block of 14 days and of 10 variables.
+    """
+    n_days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+    return n_locations * math.ceil(n_days / 14) * math.ceil(n_variables / 10)
+
+
+def fetch_batched(provider, points, start_date, end_date, variables=None, limiter=None, retry_budget=3):
+    """
+    Fetch many (latitude, longitude) points, packed into as few requests as the provider allows.
+    Every request waits for its weight on the token bucket; failed requests are retried with
+    exponential backoff until the shared retry budget is spent. Returns one frame per point, in order.
+    """
+    variables = list(variables or WEATHER_VARIABLES)
+    limiter = limiter or _LIMITER
+    step = max(1, provider.max_locations_per_call)
+
+    frames = []
+    attempt = 0
+    for i in range(0, len(points), step):
+        chunk = points[i:i + step]
+        while True:
+            limiter.acquire(request_weight(len(chunk), start_date, end_date, len(variables)))
+            try:
+                frames.extend(provider.fetch_many(chunk, start_date, end_date, variables))
+                break
+            except Exception as e:
+                if retry_budget <= 0:
+                    raise
+                retry_budget -= 1
+                attempt += 1
+                print(f"Weather request failed ({e}), retrying ({retry_budget} retries left)")
+                time.sleep(min(30, 0.5 * 2 ** attempt))
+    return frames
+
+
+_PROVIDERS = {}
+
+
+def get_weather_provider(spec=None):
+    """Return the provider named by `spec` (default: $WEATHER_PROVIDER or "openmeteo"), built once per process."""
+    spec = spec or os.environ.get("WEATHER_PROVIDER", "openmeteo")
+    if spec not in _PROVIDERS:
+        if spec == "openmeteo":
+            _PROVIDERS[spec] = OpenMeteoProvider()
+        elif spec == "csv":
+            _PROVIDERS[spec] = CsvProvider()
+        elif spec == "synthetic":
+            _PROVIDERS[spec] = SyntheticProvider()
+        elif spec.startswith(("http://", "https://")):
+            _PROVIDERS[spec] = ArchiveJsonProvider(spec)
+        else:
+            raise ValueError(f"Unknown weather provider: {spec}")
+        _PROVIDERS[spec].spec = spec
+    return _PROVIDERS[spec]
+
+
+def set_weather_provider(spec):
+    """Switch the provider for this process (used by benchmarks)."""
+    get_weather_provider(spec)
+    os.environ["WEATHER_PROVIDER"] = spec
@@ -0,0 +1,132 @@
+"""
+Local on-disk store of decoded hourly weather.
+
+Every location/year is kept as one Parquet file:
+
+    data/weather_store/<source>/<location>/year=<YYYY>.parquet
+
+with a tz-aware `date` column (Europe/Oslo) and one float column per weather variable.
+<source> is the weather provider name, so offline/benchmark data never mixes with ERA5 data.
+Files are read back with memory-mapped column reads, so a restart or a new worker process
+serves a stored year without touching the network or re-decoding the API response.
+Writes go through a uniquely named temporary file, and the read-modify-write of a partition
+(append/merge) holds that partition's lock, so concurrent sessions of a worker cannot interleave.
+"""
+
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STORE_DIR = Path(__file__).resolve().parent.parent / "data" / "weather_store"
+LOCAL_TZ = "Europe/Oslo"
+DEFAULT_SOURCE = "openmeteo"
+
+
+def location_key(latitude, longitude):
+    """Folder name of a location inside the store."""
+    return f"lat={float(latitude):.4f}_lon={float(longitude):.4f}"
+
+
+def partition_path(latitude, longitude, year, source=DEFAULT_SOURCE):
+    return STORE_DIR / source / location_key(latitude, longitude) / f"year={int(year)}.parquet"
+
+
+_partition_locks = {}
+_partition_locks_guard = threading.Lock()
+
+def _partition_lock(path):
+    """Lock of one partition file (re-entrant, so a locked merge can call write_year)."""
+    with _partition_locks_guard:
+        return _partition_locks.setdefault(path, threading.RLock())
+
+
+def read_year(latitude, longitude, year, columns=None, source=DEFAULT_SOURCE):
+    """
+    Read one stored year. Returns None when the partition does not exist.
+    `columns` limits the read to the given weather variables (the `date` column is always included).
+    """
+    path = partition_path(latitude, longitude, year, source)
+    if not path.exists():
+        return None
+    if columns is not None:
+        columns = ["date"] + [c for c in columns if c != "date"]
+    table = pq.read_table(path, columns=columns, memory_map=True)
+    return table.to_pandas()
+
+
+def write_year(latitude, longitude, year, df, source=DEFAULT_SOURCE):
+    """Write one year atomically (temporary file + rename) so readers never see a partial file."""
+    path = partition_path(latitude, longitude, year, source)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name, suffix=".tmp", delete=False) as tmp:
+        tmp_path = Path(tmp.name)
+    try:
+        with _partition_lock(path):
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def last_hour(latitude, longitude, year, source=DEFAULT_SOURCE):
+    """Last stored timestamp of a year (only the `date` column is read), or None when nothing is stored."""
+    df = read_year(latitude, longitude, year, columns=[], source=source)
+    if df is None or df.empty:
+        return None
+    return df["date"].max()
+
+
+def append_frame(latitude, longitude, df, source=DEFAULT_SOURCE):
+    """
+    Append new hours to the stored years they belong to (a later value replaces a stored one for the same hour).
+    Returns the list of years that were touched.
+    """
+    if df.empty:
+        return []
+    local_year = df["date"].dt.tz_convert(LOCAL_TZ).dt.year
+    years = []
+    for year, df_new in df.groupby(local_year):
+        with _partition_lock(partition_path(latitude, longitude, year, source)):
+            df_old = read_year(latitude, longitude, year, source=source)
+            if df_old is not None:
+                df_new = (
+                    pd.concat([df_old, df_new], ignore_index=True)
+                    .drop_duplicates(subset="date", keep="last")
+                    .sort_values("date")
+                )
+            write_year(latitude, longitude, year, df_new, source)
+        years.append(year)
+    return years
+
+
+def stored_columns(latitude, longitude, year, source=DEFAULT_SOURCE):
+    """Weather variables stored for a year (read from the file schema only), or None when nothing is stored."""
+    path = partition_path(latitude, longitude, year, source)
+    if not path.exists():
+        return None
+    return [name for name in pq.read_schema(path).names if name != "date"]
+
+
+def merge_frame(latitude, longitude, df, years=None, source=DEFAULT_SOURCE):
+    """
+    Merge an hourly frame into the store column-wise: new variables are added next to the stored ones
+    (joined on `date`), so a year can be completed one variable at a time.
+    """
+    if df.empty:
+        return
+    local_year = df["date"].dt.tz_convert(LOCAL_TZ).dt.year
+    for year, df_new in df.groupby(local_year):
+        if years is not None and year not in years:
+            continue
+        with _partition_lock(partition_path(latitude, longitude, year, source)):
+            df_old = read_year(latitude, longitude, year, source=source)
+            if df_old is not None:
+                df_old = df_old.drop(columns=[c for c in df_new.columns if c != "date"], errors="ignore")
+                df_new = df_old.merge(df_new, on="date", how="outer").sort_values("date")
+            write_year(latitude, longitude, year, df_new, source)